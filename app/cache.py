@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv("CACHE_DIR", "data/cache")
+
+
+def make_key(*parts) -> str:
+    """
+    parts(문자열/dict/list)를 정렬된 JSON으로 직렬화해 SHA-256 키를 만든다.
+    """
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    data/cache/{name}/ 아래에 key 별 JSON 파일로 저장하는 캐시.
+    - max_bytes 를 넘으면 가장 오래 안 쓴(LRU) 항목부터 삭제
+    - ttl_seconds 가 지난 항목은 miss 로 취급하고 삭제
+    - hits / misses / evictions 카운터 제공
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: float):
+        self.name = name
+        self.dir = os.path.join(CACHE_DIR, name)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._index = None  # key -> size (LRU 순서, 앞쪽이 오래된 것)
+        self._bytes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+
+        entries = []
+        if os.path.isdir(self.dir):
+            for root, _, files in os.walk(self.dir):
+                for fn in files:
+                    if not fn.endswith(".json"):
+                        continue
+                    st = os.stat(os.path.join(root, fn))
+                    entries.append((st.st_mtime, fn[:-5], st.st_size))
+
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._bytes = sum(self._index.values())
+
+    def _drop(self, key: str):
+        size = self._index.pop(key, 0)
+        self._bytes -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str):
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            if self.ttl_seconds and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            # LRU: 마지막 사용 시각을 mtime 으로 남겨 재시작 후에도 순서를 복원
+            os.utime(path)
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry.get("value")
+
+    def set(self, key: str, value):
+        payload = json.dumps(
+            {"created_at": time.time(), "value": value},
+            ensure_ascii=False
+        ).encode("utf-8")
+
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = len(payload)
+            self._bytes += len(payload)
+
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                oldest = next(iter(self._index))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index) if self._index is not None else None,
+                "bytes": self._bytes if self._index is not None else None,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+class MemoryLRU:
+    """
+    프로세스 메모리 LRU (maxsize 개 항목)
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._items),
+                "maxsize": self.maxsize,
+            }
+
+
+class TieredCache:
+    """
+    MemoryLRU 앞단 + DiskCache 뒷단.
+    disk 에서 찾은 값은 memory 로 올려서 다음 조회는 파일 IO 없이 처리한다.
+    """
+
+    def __init__(self, memory: MemoryLRU, disk: DiskCache):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def get_memory(self, key: str):
+        return self.memory.get(key)
+
+    def set(self, key: str, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
+
+
+# ---------------------------
+# Document Parse / Information Extraction 결과 캐시
+#   key = sha256(업로드 bytes) + 모델/설정 파라미터
+# ---------------------------
+
+EXTRACT_CACHE_ENABLED = os.getenv("EXTRACT_CACHE_ENABLED", "1") == "1"
+
+extract_cache = DiskCache(
+    "extract",
+    max_bytes=int(float(os.getenv("EXTRACT_CACHE_MAX_MB", "512")) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("EXTRACT_CACHE_TTL_HOURS", "168")) * 3600,
+)
+
+
+def docparse_cache_key(file_sha256: str, params: dict) -> str:
+    return make_key("document-parse", file_sha256, params)
+
+
+def ie_cache_key(file_sha256: str, model: str, json_schema: dict) -> str:
+    return make_key("information-extract", file_sha256, model, make_key(json_schema))
+
+
+# ---------------------------
+# Solar 응답 캐시 (temperature=0 이라 같은 입력이면 같은 출력)
+#   key = model + sha256(system) + sha256(user)
+# ---------------------------
+
+SOLAR_CACHE_ENABLED = os.getenv("SOLAR_CACHE_ENABLED", "1") == "1"
+
+solar_cache = TieredCache(
+    MemoryLRU(int(os.getenv("SOLAR_CACHE_MEMORY_ITEMS", "1024"))),
+    DiskCache(
+        "solar",
+        max_bytes=int(float(os.getenv("SOLAR_CACHE_MAX_MB", "128")) * 1024 * 1024),
+        ttl_seconds=float(os.getenv("SOLAR_CACHE_TTL_HOURS", "720")) * 3600,
+    ),
+)
+
+
+def solar_cache_key(model: str, system: str, user: str) -> str:
+    return make_key(
+        "solar",
+        model,
+        hashlib.sha256(system.encode("utf-8")).hexdigest(),
+        hashlib.sha256(user.encode("utf-8")).hexdigest(),
+    )
@@ -0,0 +1,242 @@
+import re
+from html.parser import HTMLParser
+
+# ---------------------------
+# Document Parse HTML -> 약 목록 표의 행 index / compact 텍스트
+# (base64 figure / 스타일 / 레이아웃 마크업은 행 단위 용법 확인에 필요 없다)
+# ---------------------------
+
+MED_HEADER_KEYWORDS = ("명칭", "약품", "의약품", "약명", "용법", "투약", "투여")
+FIELD_KEYWORDS = (
+    ("drug_name", ("명칭", "약품명", "의약품", "약명")),
+    ("dose_per_time", ("1회",)),
+    ("times_per_day", ("1일", "횟수")),
+    ("total_days", ("총", "일수")),
+    ("instructions", ("용법",)),
+)
+_SKIP_TAGS = {"script", "style", "img", "figure"}
+_WS_RE = re.compile(r"\s+")
+_LEADING_NUMBER_RE = re.compile(r"^\d+\s*")
+
+
+def _clean(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip()
+
+
+class _TableParser(HTMLParser):
+    """
+    <table> 안의 <tr>/<td|th> 텍스트만 모은다. 표 밖의 텍스트는 text_blocks 로 따로 둔다.
+    colspan 은 같은 값을 반복해서 열 위치를 맞춘다. 생략된 </tr> / </td> / </th> 는 다음 시작 태그에서 닫는다.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []
+        self.text_blocks = []
+        self._table = None
+        self._row = None
+        self._cell = None
+        self._colspan = 1
+        self._skip = 0
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            if tag != "img":
+                self._skip += 1
+            return
+        if tag == "table":
+            self._depth += 1
+            if self._depth == 1:
+                self._table = []
+        elif self._depth != 1:
+            return
+        elif tag == "tr":
+            self._end_row()  # </tr> 생략 허용
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._end_cell()  # </td>, </th> 생략 허용
+            self._cell = []
+            try:
+                self._colspan = max(1, int(dict(attrs).get("colspan") or 1))
+            except ValueError:
+                self._colspan = 1
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            if tag != "img":
+                self._skip = max(0, self._skip - 1)
+            return
+        if tag == "table":
+            if self._depth == 1 and self._table is not None:
+                self._end_row()
+                if self._table:
+                    self.tables.append(self._table)
+                self._table = None
+            self._depth = max(0, self._depth - 1)
+        elif self._depth != 1:
+            return
+        elif tag in ("td", "th"):
+            self._end_cell()
+        elif tag == "tr":
+            self._end_row()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._cell is not None:
+            self._cell.append(data)
+        elif self._depth == 0 and data.strip():
+            self.text_blocks.append(_clean(data))
+
+    def _end_cell(self):
+        if self._cell is None or self._row is None:
+            return
+        text = _clean("".join(self._cell))
+        self._row.extend([text] * self._colspan)
+        self._cell = None
+        self._colspan = 1
+
+    def _end_row(self):
+        self._end_cell()
+        if self._row is not None and self._table is not None and any(self._row):
+            self._table.append(self._row)
+        self._row = None
+
+
+def parse_tables(html: str) -> tuple[list, list]:
+    """
+    returns: (tables[table][row][cell], 표 밖 텍스트 블록 목록)
+    """
+    p = _TableParser()
+    p.feed(html or "")
+    p.close()
+    return p.tables, p.text_blocks
+
+
+def _header_index(table: list) -> int | None:
+    """
+    keyword 가 들어 있는 셀이 2개 이상인 첫 행. ("전문의약품" 한 셀이 "약품"/"의약품" 둘로 세지지 않게 셀 단위로 센다)
+    """
+    for i, row in enumerate(table):
+        if sum(1 for cell in row if any(k in cell for k in MED_HEADER_KEYWORDS)) >= 2:
+            return i
+    return None
+
+
+def _header_columns(header: list | None) -> dict:
+    """
+    header 셀 -> {field: 열 index}. drug_name 열을 못 찾으면 0번 열.
+    """
+    columns = {}
+    for i, cell in enumerate(header or []):
+        for field, keywords in FIELD_KEYWORDS:
+            if field not in columns and any(k in cell for k in keywords):
+                columns[field] = i
+                break
+    columns.setdefault("drug_name", 0)
+    return columns
+
+
+def normalize_drug_name(name: str) -> str:
+    """
+    행 번호 / 공백 / 대소문자 차이를 없앤 약 이름 key
+    """
+    name = _LEADING_NUMBER_RE.sub("", (name or "").strip())
+    return _WS_RE.sub("", name).lower()
+
+
+def build_row_index(html: str) -> dict:
+    """
+    DP HTML 을 한 번만 파싱해서 약 목록 표의 행 index 를 만든다. (html.parser 기반, 재귀 없음)
+    {
+      "header": [...] | None,
+      "columns": {"drug_name": 0, "instructions": 4, ...},
+      "rows": [{"key": 정규화 약 이름, "cells": [...], "fields": {"drug_name": ..., "instructions": ...}}],
+      "by_drug": {key: rows 위치},
+    }
+    """
+    tables, _ = parse_tables(html)
+
+    header, raw_rows = None, []
+    for table in tables:
+        idx = _header_index(table)
+        if idx is None:
+            # header 없이 다음 페이지로 이어진 표: 열 개수가 header 와 같은 행만 이어 붙인다
+            if header is not None:
+                raw_rows.extend(r for r in table if len(r) == len(header))
+            continue
+        if header is None:
+            header = table[idx]
+        raw_rows.extend(r for r in table[idx + 1:] if r != table[idx])
+    if header is None:
+        raw_rows = [r for table in tables for r in table]
+
+    columns = _header_columns(header)
+    rows, by_drug = [], {}
+    for cells in raw_rows:
+        fields = {f: cells[i] for f, i in columns.items() if i < len(cells)}
+        key = normalize_drug_name(fields.get("drug_name", ""))
+        if key and key not in by_drug:
+            by_drug[key] = len(rows)
+        rows.append({"key": key, "cells": cells, "fields": fields})
+
+    return {"header": header, "columns": columns, "rows": rows, "by_drug": by_drug}
+
+
+def lookup_row(index: dict, drug_name: str) -> dict | None:
+    """
+    약 이름으로 행을 찾는다. 정확히 같은 key 가 없으면 한쪽이 다른 쪽을 포함하는 행이 하나뿐일 때만 그 행.
+    """
+    key = normalize_drug_name(drug_name)
+    if not key:
+        return None
+    pos = index["by_drug"].get(key)
+    if pos is not None:
+        return index["rows"][pos]
+    candidates = [p for k, p in index["by_drug"].items() if key in k or k in key]
+    if len(candidates) == 1:
+        return index["rows"][candidates[0]]
+    return None
+
+
+def compact_from_index(index: dict) -> str:
+    """
+    Solar validate 프롬프트용. 약 목록 표를 한 행 = 한 줄("셀 | 셀 | ...")로 줄인다.
+    약 목록 header 를 못 찾았으면 "" -> 호출하는 쪽이 DP HTML 전체를 쓴다. (아무 표나 근거로 보내지 않는다)
+    """
+    if not index["header"] or not index["rows"]:
+        return ""
+
+    lines = [" | ".join(index["header"])]
+    lines.extend(" | ".join(r["cells"]) for r in index["rows"])
+    return "\n".join(lines)
+
+
+def compact_prescription(html: str) -> str:
+    return compact_from_index(build_row_index(html))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    대략적인 토큰 수 (영문/숫자/기호 ~4자당 1토큰, 한글 등 비 ASCII 는 1자당 1토큰)
+    """
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def compaction_stats(original: str, compact: str) -> dict:
+    before = len(original.encode("utf-8"))
+    after = len(compact.encode("utf-8"))
+    tokens_before = estimate_tokens(original)
+    tokens_after = estimate_tokens(compact)
+    return {
+        "bytes_before": before,
+        "bytes_after": after,
+        "bytes_saved": before - after,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
@@ -1,7 +1,15 @@
 import re
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import NamedTuple
 from zoneinfo import ZoneInfo
 
+DIRECTIVE_CACHE_SIZE = 1024
+
+_LEADING_NUMBER_RE = re.compile(r"^\d+\s*")
+_AFTER_MEAL_RE = re.compile(r"식후(\d+)(분|시간)")
+_MEALS = ("breakfast", "lunch", "dinner")
+
 
 def _now(tz: str) -> datetime:
     return datetime.now(ZoneInfo(tz))
@@ -18,7 +26,7 @@ def _to_int(s: str, default: int) -> int:
 def _clean_drug_name(name: str) -> str:
     name = (name or "").strip()
 
-    name = re.sub(r"^\d+\s*", "", name)
+    name = _LEADING_NUMBER_RE.sub("", name)
     return name
 
 
@@ -36,13 +44,6 @@ def _dt_at(date: datetime, hhmm: str, tz: str) -> datetime:
     return datetime(date.year, date.month, date.day, h, m, tzinfo=ZoneInfo(tz))
 
 
-def _rollover_if_past(dt: datetime, tz: str, only_if_today: bool) -> datetime:
-
-    if only_if_today and dt <= _now(tz):
-        return dt + timedelta(days=1)
-    return dt
-
-
 def _evenly_spaced_times(start: datetime, end: datetime, count: int) -> list[datetime]:
     if count <= 1:
         return [start]
@@ -57,7 +58,7 @@ def _extract_after_meal_minutes(inst: str) -> int | None:
     없으면 None.
     """
     s = (inst or "").replace(" ", "")
-    m = re.search(r"식후(\d+)(분|시간)", s)
+    m = _AFTER_MEAL_RE.search(s)
     if not m:
         return None
     n = int(m.group(1))
@@ -65,6 +66,49 @@ def _extract_after_meal_minutes(inst: str) -> int | None:
     return n if unit == "분" else n * 60
 
 
+class Directive(NamedTuple):
+    """
+    용법 문자열 하나를 해석한 결과.
+    - anchors / offset_minutes: 기준 식사들과 식사 후 몇 분 (비어 있으면 기상~취침 사이 균등 분배)
+    - bedtime_dose: 취침 30분 전 dose 추가 여부
+    - interval: 'N시간마다' 균등 분배
+    - after_meal / after_meal_minutes / bedtime: 메시지 문구용 (원문에 식후 / 식후N분 / 취침전 이 있는지)
+    """
+    rule: str
+    anchors: tuple
+    offset_minutes: int
+    bedtime_dose: bool
+    interval: bool
+    after_meal: bool
+    after_meal_minutes: int | None
+    bedtime: bool
+
+
+@lru_cache(maxsize=DIRECTIVE_CACHE_SIZE)
+def _parse_compact(inst_compact: str) -> Directive:
+    after_meal = "식후" in inst_compact
+    bedtime = "취침전" in inst_compact
+    mins = _extract_after_meal_minutes(inst_compact)
+    flags = dict(after_meal=after_meal, after_meal_minutes=mins, bedtime=bedtime)
+
+    if bedtime and after_meal:
+        return Directive("after_meal_plus_before_sleep", _MEALS, 20, True, False, **flags)
+    if mins is not None:
+        return Directive("after_meal_numbered", _MEALS, mins, False, False, **flags)
+    if "시간마다" in inst_compact:
+        return Directive("times_per_day_spread", (), 0, False, True, **flags)
+    if after_meal:
+        return Directive("after_meal_default", _MEALS, 20, False, False, **flags)
+    return Directive("fallback_spread", (), 0, False, False, **flags)
+
+
+def parse_instruction(inst: str) -> Directive:
+    """
+    공백을 뺀 용법 문자열 기준 LRU 캐시. 같은 용법은 한 번만 해석한다.
+    """
+    return _parse_compact((inst or "").replace(" ", ""))
+
+
 def med_message(name: str, action: str, inst: str) -> str:
     """
     - '식후30분'처럼 숫자가 있으면: '식사 30분 후 ... 잊지 마세요, 꼭이요!'
@@ -73,9 +117,9 @@ def med_message(name: str, action: str, inst: str) -> str:
     - 취침전은: '취침 전 ...'
     - fallback은: '{name} {action} 시간이에요, 꼭이요!'
     """
-    inst_no_space = (inst or "").replace(" ", "")
+    d = parse_instruction(inst)
 
-    mins = _extract_after_meal_minutes(inst_no_space)
+    mins = d.after_meal_minutes
     if mins is not None:
         if mins % 60 == 0 and mins >= 60:
             hours = mins // 60
@@ -84,136 +128,125 @@ def med_message(name: str, action: str, inst: str) -> str:
             when = f"식사 {mins}분 후"
         return f"{when} {name} {action} 잊지 마세요, 꼭이요!"
 
-    if "식후" in inst_no_space:
+    if d.after_meal:
         return f"식사 후 {name} {action} 잊지 마세요, 꼭이요!"
 
-    if "취침전" in inst_no_space:
+    if d.bedtime:
         return f"취침 전 {name} {action} 잊지 마세요, 꼭이요!"
 
     return f"{name} {action} 시간이에요, 꼭이요!"
 
 
-def build_med_schedules(validated: dict, meal_times: dict, wake_sleep: dict, tz="Asia/Seoul"):
+def _spread_targets(day_date: datetime, wake_sleep: dict, tz: str, per_day: int, now) -> list[datetime]:
+    start = _dt_at(day_date, wake_sleep["wake"], tz)
+    end = _dt_at(day_date, wake_sleep["sleep"], tz)
+
+    if now is not None and start <= now:
+        start = start + timedelta(days=1)
+    end = start.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+    if end <= start:
+        end += timedelta(days=1)
+
+    return _evenly_spaced_times(start, end, per_day)
+
+
+def _day_targets(d: Directive, per_day: int, day_date: datetime, meal_times: dict, wake_sleep: dict, tz: str, now=None):
     """
-    times_per_day / total_days를 반드시 반영해서 '총 스케줄 개수'가 초과하지 않게 만든다.
-    - per_day = 1일 투여횟수
-    - days = 총 투약일수
+    하루치 (rule, 복약 시각 목록).
+    now 가 주어지면(첫째 날) 이미 지난 시각은 다음 날로 이월한다.
+    """
+    if not d.anchors:
+        return d.rule, _spread_targets(day_date, wake_sleep, tz, per_day, now)
+
+    offset = timedelta(minutes=d.offset_minutes)
+    targets = [_dt_at(day_date, meal_times[m], tz) + offset for m in d.anchors]
+    if d.bedtime_dose:
+        targets.append(_dt_at(day_date, wake_sleep["sleep"], tz) - timedelta(minutes=30))
+
+    if now is not None:
+        targets = [t + timedelta(days=1) if t <= now else t for t in targets]
+    return d.rule, targets[:per_day]
+
+
+def build_med_rules(validated: dict, meal_times: dict, wake_sleep: dict, tz="Asia/Seoul") -> list[dict]:
+    """
+    약 1개 = 반복 규칙 1개. 총 투약일수와 무관하게 크기가 일정하다.
+    - first_day: 첫째 날 복약 시각 (이미 지난 시각은 다음 날로 이월)
+    - base_day: 기준일 시각. N번째 날(N>=2)은 여기에 (N-1)일을 더한 시각
+    - days: 총 투약일수
     """
 
     now = _now(tz)
-    base_date = now
 
-    schedules = []
+    rules = []
     meds = validated.get("medications", [])
 
     for med in meds:
         raw_name = (med.get("drug_name") or "").strip()
         name = _clean_drug_name(raw_name)
         inst = (med.get("instructions") or "").strip()
-        inst_compact = inst.replace(" ", "")
+        directive = parse_instruction(inst)
         action = _action_word(raw_name)
 
         per_day = _to_int(med.get("times_per_day", "0"), 1)
         days = _to_int(med.get("total_days", "0"), 1)
 
-        for day_idx in range(days):
-            day_date = base_date + timedelta(days=day_idx)
-            only_if_today = (day_idx == 0)
-
-     
-            if "취침전" in inst_compact and "식후" in inst_compact:
-                targets = [
-                    _dt_at(day_date, meal_times["breakfast"], tz) + timedelta(minutes=20),
-                    _dt_at(day_date, meal_times["lunch"], tz) + timedelta(minutes=20),
-                    _dt_at(day_date, meal_times["dinner"], tz) + timedelta(minutes=20),
-                    _dt_at(day_date, wake_sleep["sleep"], tz) - timedelta(minutes=30),
-                ]
-                targets = [_rollover_if_past(t, tz, only_if_today) for t in targets]
-                targets = targets[:per_day]  
-
-                for t in targets:
-                    schedules.append({
-                        "fire_at": t.isoformat(),
-                        "type": "MED",
-                        "message": med_message(name, action, inst),
-                        "meta": {"drug_name": name, "rule": "after_meal_plus_before_sleep", "raw_instructions": inst, "day": day_idx + 1}
-                    })
-                continue
-
-        
-            mins = _extract_after_meal_minutes(inst_compact)
-            if mins is not None:
-                targets = [
-                    _dt_at(day_date, meal_times["breakfast"], tz) + timedelta(minutes=mins),
-                    _dt_at(day_date, meal_times["lunch"], tz) + timedelta(minutes=mins),
-                    _dt_at(day_date, meal_times["dinner"], tz) + timedelta(minutes=mins),
-                ]
-                targets = [_rollover_if_past(t, tz, only_if_today) for t in targets]
-                targets = targets[:per_day] 
-
-                for t in targets:
-                    schedules.append({
-                        "fire_at": t.isoformat(),
-                        "type": "MED",
-                        "message": med_message(name, action, inst),
-                        "meta": {"drug_name": name, "rule": "after_meal_numbered", "raw_instructions": inst, "day": day_idx + 1}
-                    })
-                continue
-
-            if "시간마다" in inst_compact:
-                start = _dt_at(day_date, wake_sleep["wake"], tz)
-                end = _dt_at(day_date, wake_sleep["sleep"], tz)
-
-                start = _rollover_if_past(start, tz, only_if_today)
-                end = start.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
-                if end <= start:
-                    end += timedelta(days=1)
-
-                targets = _evenly_spaced_times(start, end, per_day)
-
-                for t in targets:
-                    schedules.append({
-                        "fire_at": t.isoformat(),
-                        "type": "MED",
-                        "message": med_message(name, action, inst),
-                        "meta": {"drug_name": name, "rule": "times_per_day_spread", "raw_instructions": inst, "day": day_idx + 1}
-                    })
-                continue
-
-
-            if "식후" in inst_compact:
-                targets = [
-                    _dt_at(day_date, meal_times["breakfast"], tz) + timedelta(minutes=20),
-                    _dt_at(day_date, meal_times["lunch"], tz) + timedelta(minutes=20),
-                    _dt_at(day_date, meal_times["dinner"], tz) + timedelta(minutes=20),
-                ]
-                targets = [_rollover_if_past(t, tz, only_if_today) for t in targets]
-                targets = targets[:per_day]
-
-                for t in targets:
-                    schedules.append({
-                        "fire_at": t.isoformat(),
-                        "type": "MED",
-                        "message": med_message(name, action, inst),
-                        "meta": {"drug_name": name, "rule": "after_meal_default", "raw_instructions": inst, "day": day_idx + 1}
-                    })
-                continue
-
-
-            start = _dt_at(day_date, wake_sleep["wake"], tz)
-            end = _dt_at(day_date, wake_sleep["sleep"], tz)
-            start = _rollover_if_past(start, tz, only_if_today)
-            end = start.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
-            if end <= start:
-                end += timedelta(days=1)
-
-            targets = _evenly_spaced_times(start, end, per_day)
-            for t in targets:
-                schedules.append({
-                    "fire_at": t.isoformat(),
-                    "type": "MED",
-                    "message": med_message(name, action, inst),
-                    "meta": {"drug_name": name, "rule": "fallback_spread", "raw_instructions": inst, "day": day_idx + 1}
-                })
-
-    return schedules
\ No newline at end of file
+        rule, first_day = _day_targets(directive, per_day, now, meal_times, wake_sleep, tz, now=now)
+        base_day = []
+        if days > 1:
+            _, base_day = _day_targets(directive, per_day, now, meal_times, wake_sleep, tz)
+
+        rules.append({
+            "type": "MED",
+            "message": med_message(name, action, inst),
+            "meta": {"drug_name": name, "rule": rule, "raw_instructions": inst},
+            "tz": tz,
+            "first_day": [t.isoformat() for t in first_day],
+            "base_day": [t.isoformat() for t in base_day],
+            "days": days,
+        })
+
+    return rules
+
+
+def med_rule_count(rule: dict) -> int:
+    return len(rule["first_day"]) + len(rule["base_day"]) * max(0, rule["days"] - 1)
+
+
+def expand_med_rule(rule: dict, start_day: int = 1, end_day: int | None = None):
+    """
+    start_day ~ end_day (1부터, 양끝 포함) 범위의 스케줄 dict 를 순서대로 생성한다.
+    """
+    days = rule["days"]
+    end_day = days if end_day is None else min(end_day, days)
+    message = rule["message"]
+    meta = rule["meta"]
+
+    if start_day <= 1 <= end_day:
+        for fire_at in rule["first_day"]:
+            yield {"fire_at": fire_at, "type": rule["type"], "message": message, "meta": {**meta, "day": 1}}
+
+    if end_day < 2:
+        return
+
+    tzinfo = ZoneInfo(rule["tz"])
+    base_day = [datetime.fromisoformat(x).replace(tzinfo=tzinfo) for x in rule["base_day"]]
+    for day_idx in range(max(start_day, 2), end_day + 1):
+        shift = timedelta(days=day_idx - 1)
+        for t in base_day:
+            yield {"fire_at": (t + shift).isoformat(), "type": rule["type"], "message": message, "meta": {**meta, "day": day_idx}}
+
+
+def build_med_schedules(validated: dict, meal_times: dict, wake_sleep: dict, tz="Asia/Seoul"):
+    """
+    times_per_day / total_days를 반드시 반영해서 '총 스케줄 개수'가 초과하지 않게 만든다.
+    - per_day = 1일 투여횟수
+    - days = 총 투약일수
+
+    약마다 하루치 시각(첫째 날: 지난 시각 이월 / 이후: 기준일 시각)을 한 번만 계산하고,
+    둘째 날부터는 기준일 시각에 day 만큼 더해서 펼친다. (now / 메시지도 한 번만 계산)
+    """
+    schedules = []
+    for rule in build_med_rules(validated, meal_times, wake_sleep, tz=tz):
+        schedules.extend(expand_med_rule(rule))
+    return schedules
@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+from app.storage import save_json, load_json
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """
+    /runs 로 제출된 파이프라인 1건의 상태.
+    status: queued -> running -> succeeded | failed
+    stage: 마지막으로 끝난 파이프라인 단계 (saved, docparse, ie, validated, push, schedules)
+    events: 단계별 {event, elapsed_ms, stage_ms, summary} 기록 (SSE 로 전달)
+    """
+
+    def __init__(self, run_id: str, run_path: str):
+        self.run_id = run_id
+        self.run_path = run_path
+        self.status = "queued"
+        self.stage = None
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.events = []
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._changed = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "result": self.result,
+            "error": self.error,
+            "events": self.events,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def _persist(self):
+        save_json(self.run_path, "status.json", self.to_dict())
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def _emit(self, event: str, summary: dict):
+        now = time.time()
+        last = self.events[-1]["at"] if self.events else self.created_at
+        self.events.append({
+            "event": event,
+            "at": now,
+            "elapsed_ms": round((now - self.created_at) * 1000, 1),
+            "stage_ms": round((now - last) * 1000, 1),
+            "summary": summary,
+        })
+        self.updated_at = now
+        self._persist()
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def set_stage(self, stage: str, summary: dict | None = None):
+        self.stage = stage
+        self.stages.append(stage)
+        self._emit(stage, summary or {})
+
+    def set_status(self, status: str, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        if status == "succeeded":
+            self._emit("done", result or {})
+        elif status == "failed":
+            self._emit("error", {"error": error})
+        else:
+            self._emit(status, {})
+
+    async def wait_change(self, timeout: float):
+        """
+        다음 이벤트가 생기거나 timeout 이 지날 때까지 대기. 이벤트가 생겼으면 True.
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class JobManager:
+    """
+    bounded asyncio worker pool.
+    submit() 는 큐가 가득 차면 JobQueueFull 을 던진다. (엔드포인트에서 503)
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def register(self, job: Job) -> Job:
+        self.jobs[job.run_id] = job
+        while len(self.jobs) > JOB_HISTORY:
+            self.jobs.popitem(last=False)
+        return job
+
+    def submit(self, job: Job, work):
+        """
+        work(job): 파이프라인을 실행하고 결과 dict 를 돌려주는 coroutine 함수
+        """
+        try:
+            self._queue.put_nowait((job, work))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"job queue is full ({self.queue_size})")
+        self.register(job)
+        job._persist()
+
+    def job(self, run_id: str):
+        return self.jobs.get(run_id)
+
+    def get(self, run_id: str, run_path: str | None = None):
+        job = self.jobs.get(run_id)
+        if job is not None:
+            return job.to_dict()
+        if run_path:
+            return load_json(run_path, "status.json")
+        return None
+
+    async def _worker(self, idx: int):
+        while True:
+            job, work = await self._queue.get()
+            try:
+                job.set_status("running")
+                result = await work(job)
+                job.set_status("succeeded", result=result)
+            except Exception as e:
+                print(f"[JOB:{job.run_id}] ERROR:", repr(e))
+                job.set_status("failed", error=str(e))
+            finally:
+                self._queue.task_done()
+
+
+jobs = JobManager()
@@ -1,49 +1,106 @@
 import os, json
+import time
+import asyncio
+import hashlib
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
 
-from app.storage import new_run_dir, save_text, save_json
-from app.scheduler import start_scheduler, store
-
-from app.upstage_client import (
-    document_parse,
-    extract_html_from_docparse,
-    universal_extract,
-    solar_chat
-)
-from app.prompts import (
-    VALIDATE_SYSTEM,
-    validate_user_prompt,
-    PUSH_SYSTEM,
-    push_user_prompt
+from app.storage import (
+    new_run_dir,
+    discard_run_dir,
+    run_dir,
+    load_json,
+    file_sha256 as sha256_of_file,
+    upload_tmp_path,
+    put_blob,
+    link_input,
 )
-from app.instruction_parser import build_med_schedules
+from app.scheduler import start_scheduler, store, SCHEDULER_MODE
+from app.cache import extract_cache, solar_cache
+from app.upstage_async_client import warm_clients, close_clients
+from app.pipeline import run_pipeline
+from app.jobs import jobs, Job, JobQueueFull
+from app.resilience import POLICIES as UPSTREAM_POLICIES
+from app import metrics
 
 load_dotenv()
 TZ = os.getenv("TIMEZONE", "Asia/Seoul")
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_INBOX_DIR = os.getenv("BATCH_INBOX_DIR", "data/inbox")
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "30")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
 
 app = FastAPI(title="Upstage Prescription AI Agent (Prototype)")
 
 @app.on_event("startup")
-def _startup():
+async def _startup():
     os.makedirs("data/uploads", exist_ok=True)
     os.makedirs("data/runs", exist_ok=True)
     start_scheduler(tz=TZ)
-    print("[SCHEDULER] started")
+    print(f"[SCHEDULER] started (mode={SCHEDULER_MODE})")
+    await warm_clients()
+    print("[UPSTAGE] clients warmed")
+    await jobs.start()
+    print(f"[JOBS] started (workers={jobs.workers}, queue={jobs.queue_size})")
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await jobs.stop()
+    await close_clients()
 
 
-def future_at(hhmm: str, tz: str) -> str:
+def _too_large():
+    return HTTPException(status_code=413, detail=f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+
+
+async def save_upload(pdf: UploadFile, run_id: str, run_path: str):
     """
-    오늘 HH:MM. 이미 지난 시간이면 내일로 이월.
+    업로드를 UPLOAD_CHUNK_SIZE 단위로 읽어 디스크에 쓰면서 sha256 / 크기를 같이 계산한다.
+    (파일 전체를 메모리에 올리지 않음. MAX_UPLOAD_BYTES 를 넘으면 413)
+    내용은 sha256 blob 으로 한 번만 저장하고, run 디렉터리에는 링크를 둔다.
     """
-    now = datetime.now(ZoneInfo(tz))
-    h, m = map(int, hhmm.split(":"))
-    dt = now.replace(hour=h, minute=m, second=0, microsecond=0)
-    if dt <= now:
-        dt = dt + timedelta(days=1)
-    return dt.isoformat()
+    if pdf.size is not None and pdf.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
+    filename = pdf.filename or f"{run_id}.bin"
+    tmp_path = upload_tmp_path(run_id)
+
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := await pdf.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise _too_large()
+                h.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    sha256 = h.hexdigest()
+    blob, created = put_blob(tmp_path, sha256)
+    file_path = link_input(run_path, blob, filename, sha256, size)
+
+    print(f"[RUN:{run_id}] saved file -> {blob} ({size} bytes, {'new' if created else 'dedup'})")
+    metrics.add_bytes("upload", size)
+    return file_path, sha256, size
+
+
+async def _save_or_discard(pdf: UploadFile, run_id: str, run_path: str):
+    """
+    save_upload 가 실패하면 (413 등) 방금 만든 빈 run 디렉터리를 지우고 예외를 그대로 올린다.
+    """
+    try:
+        return await save_upload(pdf, run_id, run_path)
+    except BaseException:
+        discard_run_dir(run_path)
+        raise
 
 
 @app.post("/run")
@@ -56,131 +113,356 @@ async def run_agent(
     sleep: str = "22:00",
 ):
     run_id, run_path = new_run_dir()
+    print(f"[RUN:{run_id}] start")
+
+    # 413 은 그대로 돌려준다 (아래 catch-all 이 500 으로 바꾸지 않게 try 밖에서 저장)
+    file_path, file_sha256, size = await _save_or_discard(pdf, run_id, run_path)
+    job = jobs.register(Job(run_id, run_path))
 
     try:
-        print(f"[RUN:{run_id}] start")
-
-  
-        file_bytes = await pdf.read()
-        filename = pdf.filename or f"{run_id}.bin"
-        file_path = os.path.join("data", "uploads", filename)
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-        print(f"[RUN:{run_id}] saved file -> {file_path} ({len(file_bytes)} bytes)")
-
- 
-        print(f"[RUN:{run_id}] calling document_parse...")
-        docparse_json = document_parse(file_path)
-        save_json(run_path, "docparse_response.json", docparse_json)
-
-        html = extract_html_from_docparse(docparse_json)
-        save_text(run_path, "docparse.html", html)
-        print(f"[RUN:{run_id}] docparse saved -> {os.path.join(run_path, 'docparse.html')} (len={len(html)})")
-
-      
-        print(f"[RUN:{run_id}] calling universal_extract...")
-        prescription_schema = {
-            "type": "object",
-            "properties": {
-                "medications": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "drug_name": {"type": "string"},
-                            "dose_per_time": {"type": "string"},
-                            "times_per_day": {"type": "string"},
-                            "total_days": {"type": "string"},
-                            "instructions": {"type": "string"}
-                        },
-                        "required": [
-                            "drug_name",
-                            "dose_per_time",
-                            "times_per_day",
-                            "total_days",
-                            "instructions"
-                        ]
-                    }
-                }
-            },
-            "required": ["medications"]
-        }
+        job.set_status("running")
+        job.set_stage("saved", {"filename": pdf.filename, "bytes": size})
+
+        with metrics.timed("run"):
+            result = await run_pipeline(
+                run_id,
+                run_path,
+                file_path,
+                file_sha256,
+                meal_times={"breakfast": breakfast, "lunch": lunch, "dinner": dinner},
+                wake_sleep={"wake": wake, "sleep": sleep},
+                on_stage=job.set_stage,
+            )
+        job.set_status("succeeded", result=result)
+        return result
+
+    except Exception as e:
+        print(f"[RUN:{run_id}] ERROR:", repr(e))
+        job.set_status("failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/runs", status_code=202)
+async def submit_run(
+    pdf: UploadFile = File(...),
+    breakfast: str = "08:00",
+    lunch: str = "12:30",
+    dinner: str = "19:00",
+    wake: str = "08:00",
+    sleep: str = "22:00",
+):
+    """
+    /run 의 비동기 버전. 업로드만 저장하고 바로 run_id 를 돌려준다.
+    진행 상황과 결과는 GET /runs/{run_id} 로 조회.
+    """
+    run_id, run_path = new_run_dir()
+    print(f"[RUN:{run_id}] submit")
+
+    file_path, file_sha256, size = await _save_or_discard(pdf, run_id, run_path)
+    job = Job(run_id, run_path)
+    job.set_stage("saved", {"filename": pdf.filename, "bytes": size})
+
+    async def work(job):
+        with metrics.timed("run"):
+            return await run_pipeline(
+                run_id,
+                run_path,
+                file_path,
+                file_sha256,
+                meal_times={"breakfast": breakfast, "lunch": lunch, "dinner": dinner},
+                wake_sleep={"wake": wake, "sleep": sleep},
+                on_stage=job.set_stage,
+            )
+
+    try:
+        jobs.submit(job, work)
+    except JobQueueFull as e:
+        job.set_status("failed", error=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "run_id": run_id,
+        "status": job.status,
+        "status_url": f"/runs/{run_id}",
+        "events_url": f"/runs/{run_id}/events",
+    }
+
+
+@app.get("/runs/{run_id}")
+def get_run(run_id: str):
+    status = jobs.get(run_id, run_dir(run_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    return status
+
+
+@app.get("/runs/{run_id}/docparse-index")
+def get_docparse_index(run_id: str):
+    """
+    Document Parse 표의 약 행 index (docparse_index.json)
+    """
+    path = run_dir(run_id)
+    index = load_json(path, "docparse_index.json") if path else None
+    if index is None:
+        raise HTTPException(status_code=404, detail="docparse index not found")
+    return index
+
+
+def _resolve_manifest(manifest_bytes: bytes) -> list[str]:
+    """
+    manifest: ["a.pdf", "partner/b.jpg", ...] 또는 {"files": [...]} JSON.
+    경로는 BATCH_INBOX_DIR 기준 상대 경로이며, 밖으로 나가는 경로는 거부한다.
+    """
+    try:
+        entries = json.loads(manifest_bytes.decode("utf-8"))
+    except ValueError as e:  # JSONDecodeError / UnicodeDecodeError
+        raise HTTPException(status_code=400, detail=f"invalid manifest: {e}")
+    if isinstance(entries, dict):
+        entries = entries.get("files", [])
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="invalid manifest: expected a list of files")
+
+    inbox = os.path.realpath(BATCH_INBOX_DIR)
+    paths = []
+    for e in entries:
+        rel = e.get("path") if isinstance(e, dict) else e
+        try:
+            path = os.path.realpath(os.path.join(inbox, str(rel)))
+        except ValueError:  # NUL 등
+            path = ""
+        if not path.startswith(inbox + os.sep) or not os.path.isfile(path):
+            raise HTTPException(status_code=400, detail=f"invalid manifest entry: {rel}")
+        paths.append(path)
+    return paths
+
+
+@app.post("/run/batch")
+async def run_batch(
+    files: list[UploadFile] = File(None),
+    manifest: UploadFile = File(None),
+    breakfast: str = "08:00",
+    lunch: str = "12:30",
+    dinner: str = "19:00",
+    wake: str = "08:00",
+    sleep: str = "22:00",
+    concurrency: int = BATCH_CONCURRENCY,
+):
+    """
+    여러 처방전을 한 번에 처리한다. (업로드 files 와 inbox manifest 둘 다 가능)
+    - 생활시간(breakfast/lunch/dinner/wake/sleep)은 배치 전체에 공통 적용
+    - 파일별로 run_id 를 만들고 concurrency 개씩 파이프라인을 동시에 돌린다
+    - 일부 파일이 실패해도 나머지는 계속 처리한다
+    """
+    meal_times = {"breakfast": breakfast, "lunch": lunch, "dinner": dinner}
+    wake_sleep = {"wake": wake, "sleep": sleep}
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
 
-        ie_json = universal_extract(file_path, prescription_schema)
-        save_json(run_path, "ie.json", ie_json)
-        print(f"[RUN:{run_id}] ie saved -> {os.path.join(run_path, 'ie.json')}")
-
-    
-        print(f"[RUN:{run_id}] calling solar validate...")
-        validate_user = validate_user_prompt(html, json.dumps(ie_json, ensure_ascii=False))
-        corrected_str = solar_chat(VALIDATE_SYSTEM, validate_user, model="solar-pro3")
-
-        corrected_json = json.loads(corrected_str)
-        save_json(run_path, "validated.json", corrected_json)
-        print(f"[RUN:{run_id}] validated saved -> {os.path.join(run_path, 'validated.json')}")
-
-       
-        print(f"[RUN:{run_id}] calling solar push...")
-        push_user = push_user_prompt(json.dumps(corrected_json, ensure_ascii=False))
-        push_str = solar_chat(PUSH_SYSTEM, push_user, model="solar-pro3")
-
-        push_json = json.loads(push_str)
-        save_json(run_path, "push.json", push_json)
-        print(f"[RUN:{run_id}] push saved -> {os.path.join(run_path, 'push.json')}")
-
-       
-        meal_times = {"breakfast": breakfast, "lunch": lunch, "dinner": dinner}
-        wake_sleep = {"wake": wake, "sleep": sleep}
-
-   
-        med_schedules = build_med_schedules(corrected_json, meal_times, wake_sleep, tz=TZ)
-
-      
-        habit_pushes = push_json.get("habit_pushes", [])
-
-     
-        defaults = [
-            {"time": "10:00", "habit": "물 한 잔으로 컨디션을 챙겨요 💧", "positive": "오늘도 충분히 잘하고 있어요."},
-            {"time": "16:00", "habit": "잠깐 눈 쉬고 어깨도 풀어줘요 🌿", "positive": "작은 휴식이 큰 힘이 돼요."},
-            {"time": "19:00", "habit": "저녁엔 화면 줄이고 편히 쉬어요 😊", "positive": "회복은 천천히 와도 괜찮아요."},
-        ]
-        while len(habit_pushes) < 3:
-            habit_pushes.append(defaults[len(habit_pushes)])
-
-        fixed_times = ["10:00", "16:00", "19:00"]
-        habit_schedules = []
-        for i, t in enumerate(fixed_times):
-            h = habit_pushes[i]
-            habit = (h.get("habit") or "").strip()
-            pos = (h.get("positive") or "").strip()
-            msg = f"{habit} {pos}".strip()
-
-            habit_schedules.append({
-                "fire_at": future_at(t, TZ),
-                "type": "HABIT",
-                "message": msg,
-                "meta": {"kind": f"habit_{t.replace(':','')}"}
-            })
-
-        schedules_all = med_schedules + habit_schedules
-        schedules_due = [s for s in schedules_all if s.get("fire_at")]
-
-        save_json(run_path, "schedules.json", schedules_all)
-        store.add_many(schedules_due)
-
-        print(f"[RUN:{run_id}] schedules saved -> {os.path.join(run_path, 'schedules.json')}")
-        print(f"[RUN:{run_id}] schedules added to scheduler -> {len(schedules_due)}")
+    # manifest 오류(400)는 업로드를 저장하고 run 디렉터리를 만들기 전에 낸다
+    manifest_paths = _resolve_manifest(await manifest.read()) if manifest is not None else []
+
+    inputs, rejected = [], []
+
+    def reject(filename, run_id, run_path, error):
+        # 너무 큰 파일 하나 때문에 배치 전체를 중단하지 않는다: 실패한 run 으로 남기고 계속
+        print(f"[RUN:{run_id}] rejected {filename}: {error}")
+        jobs.register(Job(run_id, run_path)).set_status("failed", error=error)
+        rejected.append({
+            "filename": filename,
+            "run_id": run_id,
+            "status": "failed",
+            "error": error,
+            "queue_ms": 0.0,
+            "elapsed_ms": 0.0,
+            "scheduled_count": 0,
+        })
+
+    for f in files or []:
+        run_id, run_path = new_run_dir()
+        try:
+            file_path, file_sha256, size = await save_upload(f, run_id, run_path)
+        except HTTPException as e:
+            reject(f.filename, run_id, run_path, e.detail)
+            continue
+        inputs.append((f.filename, run_id, run_path, file_path, file_sha256, size))
+
+    for path in manifest_paths:
+        run_id, run_path = new_run_dir()
+        size = os.path.getsize(path)
+        if size > MAX_UPLOAD_BYTES:
+            reject(os.path.basename(path), run_id, run_path, _too_large().detail)
+            continue
+        sha = await asyncio.to_thread(sha256_of_file, path)
+        metrics.add_bytes("upload", size)
+        inputs.append((os.path.basename(path), run_id, run_path, path, sha, size))
+
+    if not inputs and not rejected:
+        raise HTTPException(status_code=400, detail="no files or manifest given")
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run_one(filename, run_id, run_path, file_path, file_sha256, size):
+        job = jobs.register(Job(run_id, run_path))
+        job.set_stage("saved", {"filename": filename, "bytes": size})
+        queued = time.perf_counter()
+        async with sem:
+            started = time.perf_counter()
+            try:
+                job.set_status("running")
+                with metrics.timed("run"):
+                    result = await run_pipeline(
+                        run_id,
+                        run_path,
+                        file_path,
+                        file_sha256,
+                        meal_times=meal_times,
+                        wake_sleep=wake_sleep,
+                        on_stage=job.set_stage,
+                    )
+                job.set_status("succeeded", result=result)
+                status, error = "succeeded", None
+            except Exception as e:
+                print(f"[RUN:{run_id}] ERROR:", repr(e))
+                job.set_status("failed", error=str(e))
+                result, status, error = None, "failed", str(e)
 
         return {
+            "filename": filename,
             "run_id": run_id,
-            "artifacts_dir": run_path,
-            "meal_times": meal_times,
-            "wake_sleep": wake_sleep,
-            "medications_count": len(corrected_json.get("medications", [])),
-            "scheduled_count": len(schedules_due),
-            "note": "DP + IE + Solar(validate/push) + schedules (times/day & days considered + after-meal number in message)"
+            "status": status,
+            "error": error,
+            "queue_ms": round((started - queued) * 1000, 1),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "scheduled_count": (result or {}).get("scheduled_count", 0),
         }
 
-    except Exception as e:
-        print(f"[RUN:{run_id}] ERROR:", repr(e))
-        raise HTTPException(status_code=500, detail=str(e))
+    print(f"[BATCH] start files={len(inputs)} rejected={len(rejected)} concurrency={concurrency}")
+    started = time.perf_counter()
+    ran = await asyncio.gather(*(run_one(*i) for i in inputs))
+    elapsed = time.perf_counter() - started
+    runs = ran + rejected
+
+    succeeded = sum(1 for r in runs if r["status"] == "succeeded")
+    latencies = sorted(r["elapsed_ms"] for r in ran) or [None]
+    waits = sorted(r["queue_ms"] for r in ran) or [None]
+    print(f"[BATCH] done files={len(runs)} ok={succeeded} elapsed={elapsed:.1f}s")
+
+    return {
+        "runs": runs,
+        "stats": {
+            "files": len(runs),
+            "succeeded": succeeded,
+            "failed": len(runs) - succeeded,
+            "concurrency": concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "files_per_sec": round(len(runs) / elapsed, 3) if elapsed > 0 else None,
+            "latency_ms_p50": latencies[len(latencies) // 2],
+            "latency_ms_max": latencies[-1],
+            "queue_ms_p50": waits[len(waits) // 2],
+            "queue_ms_max": waits[-1],
+            "scheduled_total": sum(r["scheduled_count"] for r in runs),
+        },
+        "meal_times": meal_times,
+        "wake_sleep": wake_sleep,
+    }
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/runs/{run_id}/events")
+async def run_events(run_id: str):
+    """
+    파이프라인 단계가 끝날 때마다 SSE 이벤트를 보낸다.
+    (saved, docparse, ie, validated, push, schedules, 마지막에 done | error)
+    이미 끝난 run 은 status.json 에 남은 이벤트를 그대로 재생하고 종료한다.
+    """
+    job = jobs.job(run_id)
+    if job is None:
+        status = jobs.get(run_id, run_dir(run_id))
+        if status is None:
+            raise HTTPException(status_code=404, detail="run not found")
+
+        async def replay():
+            for ev in status.get("events", []):
+                yield _sse(ev["event"], ev)
+
+        return StreamingResponse(replay(), media_type="text/event-stream")
+
+    async def stream():
+        idx = 0
+        while True:
+            while idx < len(job.events):
+                ev = job.events[idx]
+                idx += 1
+                yield _sse(ev["event"], ev)
+            if job.finished:
+                return
+            if not await job.wait_change(timeout=15):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"extract": extract_cache.stats(), "solar": solar_cache.stats()}
+
+
+def _cache_counters():
+    out = {}
+    for name, st in (
+        ("extract", extract_cache.stats()),
+        ("solar_memory", solar_cache.memory.stats()),
+        ("solar_disk", solar_cache.disk.stats()),
+    ):
+        out[(name, "hit")] = st["hits"]
+        out[(name, "miss")] = st["misses"]
+    return out
+
+
+def _job_status_counts():
+    counts = {}
+    for job in list(jobs.jobs.values()):
+        counts[(job.status,)] = counts.get((job.status,), 0) + 1
+    return counts
+
+
+metrics.register(metrics.Gauge(
+    "prescription_cache_requests_total",
+    "Cache lookups by result",
+    ["cache", "result"],
+    _cache_counters,
+    mtype="counter",
+))
+metrics.register(metrics.Gauge(
+    "prescription_schedule_pending",
+    "Pending (unsent) schedule items in the store",
+    [],
+    lambda: {(): store.pending_count()},
+))
+metrics.register(metrics.Gauge(
+    "prescription_jobs",
+    "Jobs kept in memory by status",
+    ["status"],
+    _job_status_counts,
+))
+
+metrics.register(metrics.Gauge(
+    "prescription_upstream_circuit_open",
+    "1 while the Upstage endpoint's circuit breaker is open",
+    ["endpoint"],
+    lambda: {(name,): int(p.breaker.is_open()) for name, p in UPSTREAM_POLICIES.items()},
+))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus text format. 단계별 latency histogram + p50/p95/p99, 호출/에러/바이트/스케줄 카운터.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,230 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _fmt_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs += list(extra.items())
+    if not pairs:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + inner + "}"
+
+
+def _fmt_value(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus histogram (_bucket/_sum/_count) + 최근 WINDOW 개 관측치 기준 p50/p95/p99 gauge({name}_quantile)
+    """
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0, "window": deque(maxlen=WINDOW)}
+                self._series[labels] = series
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+            series["window"].append(value)
+
+    def quantiles(self, *labels) -> dict:
+        with self._lock:
+            series = self._series.get(labels)
+            window = sorted(series["window"]) if series else []
+        if not window:
+            return {}
+        return {q: window[min(len(window) - 1, int(q * len(window)))] for q in QUANTILES}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        q_lines = [
+            f"# HELP {self.name}_quantile {self.help} (last {WINDOW} observations)",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for b, n in zip(self.buckets, series["buckets"]):
+                cumulative += n
+                lines.append(
+                    f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, {'le': _fmt_value(b)})} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {_fmt_value(series['sum'])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {series['count']}")
+            for q, v in self.quantiles(*labels).items():
+                q_lines.append(
+                    f"{self.name}_quantile{_fmt_labels(self.labelnames, labels, {'quantile': q})} {_fmt_value(v)}"
+                )
+        return lines + q_lines
+
+
+class Gauge:
+    """
+    render 시점에 fn() 을 호출해 값을 읽는 metric. fn() -> {labels tuple: value}
+    (다른 모듈이 이미 세고 있는 카운터를 노출할 때는 mtype="counter")
+    """
+
+    def __init__(self, name: str, help: str, labelnames, fn, mtype: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.mtype = mtype
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.mtype}"]
+        try:
+            values = self.fn()
+        except Exception:
+            values = {}
+        for labels, v in sorted(values.items()):
+            if v is not None:
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_value(v)}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------
+# Pipeline / scheduler metrics
+# ---------------------------
+
+stage_seconds = register(Histogram(
+    "prescription_stage_duration_seconds",
+    "Latency of each pipeline / scheduler stage",
+    ["stage"],
+))
+stage_calls = register(Counter(
+    "prescription_stage_calls_total",
+    "Number of times each stage ran",
+    ["stage"],
+))
+stage_errors = register(Counter(
+    "prescription_stage_errors_total",
+    "Number of times each stage raised",
+    ["stage"],
+))
+payload_bytes = register(Counter(
+    "prescription_payload_bytes_total",
+    "Bytes of uploads, Upstage responses and prompts",
+    ["kind"],
+))
+scheduled_items = register(Counter(
+    "prescription_scheduled_items_total",
+    "Schedule items registered to the store",
+    ["type"],
+))
+validations = register(Counter(
+    "prescription_validations_total",
+    "Validation runs by mode (local = Solar skipped, partial = mismatched meds only, full)",
+    ["mode"],
+))
+push_speculation = register(Counter(
+    "prescription_push_speculation_total",
+    "Speculative push generations reused vs regenerated after validation",
+    ["outcome"],
+))
+pushes_sent = register(Counter(
+    "prescription_pushes_sent_total",
+    "Pushes delivered by the scheduler",
+    ["type"],
+))
+
+upstream_retries = register(Counter(
+    "prescription_upstream_retries_total",
+    "Retried Upstage calls (retryable errors only)",
+    ["endpoint"],
+))
+upstream_hedges = register(Counter(
+    "prescription_upstream_hedges_total",
+    "Hedged duplicate Upstage requests sent after the p95 delay",
+    ["endpoint"],
+))
+upstream_rejected = register(Counter(
+    "prescription_upstream_rejected_total",
+    "Upstage calls rejected by an open circuit breaker",
+    ["endpoint"],
+))
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    with timed("docparse"): ... -> latency / calls / errors 기록
+    """
+    started = time.perf_counter()
+    stage_calls.inc(stage)
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage)
+
+
+def add_bytes(kind: str, n: int):
+    payload_bytes.inc(kind, amount=n)
@@ -0,0 +1,375 @@
+import os, json
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from app.storage import save_text, save_json, load_json
+from app import metrics
+from app.scheduler import store
+from app.cache import (
+    EXTRACT_CACHE_ENABLED,
+    extract_cache,
+    docparse_cache_key,
+    ie_cache_key
+)
+from app.upstage_client import extract_html_from_docparse, DOCPARSE_PARAMS, IE_MODEL
+from app.docparse import build_row_index, compact_from_index, compaction_stats, normalize_drug_name
+from app.validation import cross_check, mismatch_context, merge_corrections
+from app.upstage_async_client import (
+    document_parse,
+    universal_extract,
+    solar_chat
+)
+from app.prompts import (
+    VALIDATE_SYSTEM,
+    validate_user_prompt,
+    PUSH_SYSTEM,
+    push_user_prompt
+)
+from app.instruction_parser import build_med_rules, expand_med_rule, med_rule_count
+
+TZ = os.getenv("TIMEZONE", "Asia/Seoul")
+
+# lazy: 약은 반복 규칙으로 store 에 넣고 스케줄러가 lookahead 창만큼씩 펼친다 / eager: 전체 펼쳐서 저장
+SCHEDULE_EXPANSION = os.getenv("SCHEDULE_EXPANSION", "lazy").lower()
+
+# validate 프롬프트에 DP HTML 전체 대신 약 목록 표만 줄여서 넣는다 (0 이면 HTML 그대로)
+DOCPARSE_COMPACT = os.getenv("DOCPARSE_COMPACT", "1") == "1"
+
+# IE 용법이 DP 행과 모두 일치하면 Solar validate 를 건너뛰고, 아니면 불일치 약만 보낸다 (0 이면 항상 전체 검증)
+VALIDATE_FAST_PATH = os.getenv("VALIDATE_FAST_PATH", "1") == "1"
+
+# inline: 푸시 문구 생성까지 기다린 뒤 응답 / background: 기본 습관 알림으로 먼저 응답하고 생성 후 교체
+# speculative: IE 결과의 약 이름만으로 validate 와 동시에 생성하고, 검증 후 약 목록이 같으면 그대로 쓴다
+PUSH_MODE = os.getenv("PUSH_MODE", "inline").lower()
+_background_tasks = set()
+
+PRESCRIPTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "medications": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "drug_name": {"type": "string"},
+                    "dose_per_time": {"type": "string"},
+                    "times_per_day": {"type": "string"},
+                    "total_days": {"type": "string"},
+                    "instructions": {"type": "string"}
+                },
+                "required": [
+                    "drug_name",
+                    "dose_per_time",
+                    "times_per_day",
+                    "total_days",
+                    "instructions"
+                ]
+            }
+        }
+    },
+    "required": ["medications"]
+}
+
+DEFAULT_HABITS = [
+    {"time": "10:00", "habit": "물 한 잔으로 컨디션을 챙겨요 💧", "positive": "오늘도 충분히 잘하고 있어요."},
+    {"time": "16:00", "habit": "잠깐 눈 쉬고 어깨도 풀어줘요 🌿", "positive": "작은 휴식이 큰 힘이 돼요."},
+    {"time": "19:00", "habit": "저녁엔 화면 줄이고 편히 쉬어요 😊", "positive": "회복은 천천히 와도 괜찮아요."},
+]
+
+HABIT_TIMES = ["10:00", "16:00", "19:00"]
+
+
+def future_at(hhmm: str, tz: str) -> str:
+    """
+    오늘 HH:MM. 이미 지난 시간이면 내일로 이월.
+    """
+    now = datetime.now(ZoneInfo(tz))
+    h, m = map(int, hhmm.split(":"))
+    dt = now.replace(hour=h, minute=m, second=0, microsecond=0)
+    if dt <= now:
+        dt = dt + timedelta(days=1)
+    return dt.isoformat()
+
+
+def build_habit_schedules(push_json: dict, tz: str) -> list[dict]:
+    habit_pushes = list(push_json.get("habit_pushes", []))
+
+    while len(habit_pushes) < 3:
+        habit_pushes.append(DEFAULT_HABITS[len(habit_pushes)])
+
+    habit_schedules = []
+    for i, t in enumerate(HABIT_TIMES):
+        h = habit_pushes[i]
+        habit = (h.get("habit") or "").strip()
+        pos = (h.get("positive") or "").strip()
+        msg = f"{habit} {pos}".strip()
+
+        habit_schedules.append({
+            "fire_at": future_at(t, tz),
+            "type": "HABIT",
+            "message": msg,
+            "meta": {"kind": f"habit_{t.replace(':','')}"}
+        })
+    return habit_schedules
+
+
+def push_payload(meds_json: dict) -> dict:
+    """
+    speculative 모드용 약 이름만 담은 push 입력. (IE / 검증 결과 어느 쪽이든 같은 프롬프트가 된다)
+    """
+    return {"medications": [{"drug_name": m.get("drug_name", "")} for m in meds_json.get("medications", [])]}
+
+
+def drug_set(meds_json: dict) -> set:
+    return {normalize_drug_name(m.get("drug_name")) for m in meds_json.get("medications", [])}
+
+
+def _json_response(kind: str):
+    """
+    solar_chat(parse=...) 용. 응답 크기를 기록하고 JSON 으로 파싱한다. (파싱 실패한 응답은 캐시되지 않는다)
+    """
+    def parse(content: str) -> dict:
+        metrics.add_bytes(kind, len(content.encode("utf-8")))
+        return json.loads(content)
+    return parse
+
+
+async def generate_push(run_id: str, run_path: str, corrected_json: dict) -> dict:
+    """
+    Solar 로 생활 습관 푸시 문구 생성 -> push.json
+    """
+    print(f"[RUN:{run_id}] calling solar push...")
+    push_user = push_user_prompt(json.dumps(corrected_json, ensure_ascii=False))
+    metrics.add_bytes("push_prompt", len(push_user.encode("utf-8")))
+    with metrics.timed("push"):
+        push_json = await solar_chat(PUSH_SYSTEM, push_user, model="solar-pro3", parse=_json_response("push_response"))
+
+    save_json(run_path, "push.json", push_json)
+    print(f"[RUN:{run_id}] push saved -> {os.path.join(run_path, 'push.json')}")
+    return push_json
+
+
+async def _swap_habit_pushes(run_id: str, run_path: str, corrected_json: dict, handles: list, defaults: list[dict]):
+    """
+    PUSH_MODE=background: 응답 후에 푸시 문구를 생성해서 store / schedules.json 의 기본 습관 알림을 교체한다.
+    슬롯 시각은 처음 등록한 기본 알림 시각을 그대로 쓰고, 이미 발송된 슬롯은 건드리지 않는다.
+    """
+    try:
+        push_json = await generate_push(run_id, run_path, corrected_json)
+    except Exception as e:
+        print(f"[RUN:{run_id}] background push failed, keeping default habits:", repr(e))
+        return
+
+    generated = build_habit_schedules(push_json, TZ)
+    for new, old in zip(generated, defaults):
+        new["fire_at"] = old["fire_at"]
+    swapped = store.replace_many(list(zip(handles, generated)))
+
+    schedules = load_json(run_path, "schedules.json") or []
+    it = iter(generated)
+    schedules = [next(it, s) if s.get("type") == "HABIT" else s for s in schedules]
+    save_json(run_path, "schedules.json", schedules)
+    print(f"[RUN:{run_id}] habit pushes swapped in -> {swapped}/{len(generated)}")
+
+
+async def run_pipeline(
+    run_id: str,
+    run_path: str,
+    file_path: str,
+    file_sha256: str,
+    meal_times: dict,
+    wake_sleep: dict,
+    on_stage=None,
+) -> dict:
+    """
+    DP + IE -> Solar validate -> Solar push -> schedules.
+    on_stage(stage, summary): 각 단계가 끝날 때마다 호출 (job 상태 갱신용)
+    returns: /run 응답 dict
+    """
+
+    def stage(name: str, **summary):
+        if on_stage is not None:
+            on_stage(name, summary)
+
+    cache_status = {"docparse": "off", "ie": "off"}
+
+    async def _cached(key_stage, key, call):
+        if not EXTRACT_CACHE_ENABLED:
+            return await call()
+        hit = await asyncio.to_thread(extract_cache.get, key)
+        if hit is not None:
+            cache_status[key_stage] = "hit"
+            return hit
+        cache_status[key_stage] = "miss"
+        value = await call()
+        await asyncio.to_thread(extract_cache.set, key, value)
+        return value
+
+    async def _docparse():
+        with metrics.timed("docparse"):
+            docparse_json = await _cached(
+                "docparse",
+                docparse_cache_key(file_sha256, DOCPARSE_PARAMS),
+                lambda: document_parse(file_path),
+            )
+        save_json(run_path, "docparse_response.json", docparse_json)
+
+        html = extract_html_from_docparse(docparse_json)
+        save_text(run_path, "docparse.html", html)
+        metrics.add_bytes("docparse_html", len(html.encode("utf-8")))
+        print(f"[RUN:{run_id}] docparse saved -> {os.path.join(run_path, 'docparse.html')} (len={len(html)})")
+
+        with metrics.timed("docparse_index"):
+            index = build_row_index(html)
+        save_json(run_path, "docparse_index.json", index)
+
+        compact, savings = html, None
+        if DOCPARSE_COMPACT:
+            compact = compact_from_index(index) or html
+            savings = compaction_stats(html, compact)
+            save_text(run_path, "docparse_compact.txt", compact)
+            metrics.add_bytes("docparse_compact", savings["bytes_after"])
+            print(f"[RUN:{run_id}] docparse compact -> {savings}")
+
+        stage("docparse", html_len=len(html), rows=len(index["rows"]), cache=cache_status["docparse"], compact=savings)
+        return compact, index, html
+
+    async def _ie():
+        with metrics.timed("ie"):
+            ie_json = await _cached(
+                "ie",
+                ie_cache_key(file_sha256, IE_MODEL, PRESCRIPTION_SCHEMA),
+                lambda: universal_extract(file_path, PRESCRIPTION_SCHEMA),
+            )
+        save_json(run_path, "ie.json", ie_json)
+        print(f"[RUN:{run_id}] ie saved -> {os.path.join(run_path, 'ie.json')}")
+        stage("ie", medications=ie_json.get("medications", []), cache=cache_status["ie"])
+        return ie_json
+
+    print(f"[RUN:{run_id}] calling document_parse + universal_extract (concurrent)...")
+    docparse_task = asyncio.create_task(_docparse())
+    ie_task = asyncio.create_task(_ie())
+    try:
+        (parsed, row_index, html), ie_json = await asyncio.gather(docparse_task, ie_task)
+    except BaseException:
+        # 한쪽이 실패하면 남은 호출도 취소한다 (실패한 run 에 재시도 / quota / artifact 를 쓰지 않게)
+        docparse_task.cancel()
+        ie_task.cancel()
+        raise
+    print(f"[RUN:{run_id}] extract cache -> {cache_status}")
+
+
+    async def _solar_validate(context: str, target: dict) -> dict:
+        validate_user = validate_user_prompt(context, json.dumps(target, ensure_ascii=False))
+        metrics.add_bytes("validate_prompt", len(validate_user.encode("utf-8")))
+        with metrics.timed("validate"):
+            return await solar_chat(VALIDATE_SYSTEM, validate_user, model="solar-pro3", parse=_json_response("validate_response"))
+
+    speculative_push = None
+    if PUSH_MODE == "speculative":
+        speculative_push = asyncio.create_task(generate_push(run_id, run_path, push_payload(ie_json)))
+        # validate 가 실패해서 아무도 await 하지 않아도 예외가 로그로 새지 않게 한다
+        speculative_push.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    try:
+        meds = ie_json.get("medications", [])
+        checks = cross_check(ie_json, row_index) if VALIDATE_FAST_PATH and meds else None
+        pending = [i for i, c in enumerate(checks or []) if c["status"] != "match"]
+
+        if checks is None:
+            validate_mode = "full"
+            print(f"[RUN:{run_id}] calling solar validate...")
+            corrected_json = await _solar_validate(parsed, ie_json)
+        elif not pending:
+            validate_mode = "local"
+            print(f"[RUN:{run_id}] validate: all {len(meds)} instructions match DP rows, skipping solar")
+            corrected_json = {**ie_json, "medications": [dict(m) for m in meds]}
+        else:
+            validate_mode = "partial"
+            targets = [meds[i] for i in pending]
+            print(f"[RUN:{run_id}] calling solar validate for {len(targets)}/{len(meds)} medications...")
+            # 행을 못 찾은 약이 있으면 잘린 compact 텍스트 대신 DP HTML 전체를 근거로 보낸다
+            corrected = await _solar_validate(mismatch_context(row_index, targets, html), {"medications": targets})
+            corrected_json = merge_corrections(ie_json, pending, corrected)
+
+        metrics.validations.inc(validate_mode)
+        if checks is not None:
+            save_json(run_path, "validation_check.json", checks)
+        save_json(run_path, "validated.json", corrected_json)
+        print(f"[RUN:{run_id}] validated saved -> {os.path.join(run_path, 'validated.json')} (mode={validate_mode})")
+        stage("validated", medications=corrected_json.get("medications", []), mode=validate_mode, solar_checked=len(pending) if checks is not None else len(meds))
+    except BaseException:
+        # validate 가 실패한 run 에 Solar 호출 / push.json 을 남기지 않는다
+        if speculative_push is not None:
+            speculative_push.cancel()
+        raise
+
+
+    if PUSH_MODE == "background":
+        # 기본 습관 문구로 먼저 등록하고, 생성된 문구는 나중에 교체한다 (_swap_habit_pushes)
+        push_json = {}
+        stage("push", habit_pushes=[], mode="background")
+    elif speculative_push is not None:
+        push_json = None
+        if drug_set(corrected_json) == drug_set(ie_json):
+            try:
+                push_json = await speculative_push
+            except Exception as e:
+                print(f"[RUN:{run_id}] speculative push failed, regenerating:", repr(e))
+        else:
+            speculative_push.cancel()
+        outcome = "reused" if push_json is not None else "rerun"
+        if push_json is None:
+            push_json = await generate_push(run_id, run_path, push_payload(corrected_json))
+        metrics.push_speculation.inc(outcome)
+        print(f"[RUN:{run_id}] speculative push -> {outcome}")
+        stage("push", habit_pushes=push_json.get("habit_pushes", []), mode="speculative", speculative=outcome)
+    else:
+        push_json = await generate_push(run_id, run_path, corrected_json)
+        stage("push", habit_pushes=push_json.get("habit_pushes", []))
+
+
+    with metrics.timed("build_med_schedules"):
+        med_rules = build_med_rules(corrected_json, meal_times, wake_sleep, tz=TZ)
+    habit_schedules = build_habit_schedules(push_json, TZ)
+    save_json(run_path, "rules.json", med_rules)
+
+    # schedules.json 은 기존과 같은 전체 목록 (UI / 외부 소비자용)
+    med_schedules = [s for rule in med_rules for s in expand_med_rule(rule)]
+    schedules_all = med_schedules + habit_schedules
+    save_json(run_path, "schedules.json", schedules_all)
+
+    med_count = sum(med_rule_count(rule) for rule in med_rules)
+    habit_due = [s for s in habit_schedules if s.get("fire_at")]
+    with metrics.timed("store_add"):
+        if SCHEDULE_EXPANSION == "eager":
+            store.add_many(med_schedules)
+        else:
+            store.add_rules(med_rules)
+        habit_handles = store.add_many(habit_due)
+    metrics.scheduled_items.inc("MED", amount=med_count)
+    metrics.scheduled_items.inc("HABIT", amount=len(habit_due))
+    scheduled_count = med_count + len(habit_due)
+
+    print(f"[RUN:{run_id}] schedules saved -> {os.path.join(run_path, 'schedules.json')}")
+    print(f"[RUN:{run_id}] schedules added to scheduler -> {scheduled_count} ({SCHEDULE_EXPANSION}, rules={len(med_rules)})")
+    stage("schedules", scheduled_count=scheduled_count)
+
+    if PUSH_MODE == "background":
+        task = asyncio.create_task(_swap_habit_pushes(run_id, run_path, corrected_json, habit_handles, habit_due))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    return {
+        "run_id": run_id,
+        "artifacts_dir": run_path,
+        "meal_times": meal_times,
+        "wake_sleep": wake_sleep,
+        "medications_count": len(corrected_json.get("medications", [])),
+        "scheduled_count": scheduled_count,
+        "cache": cache_status,
+        "validate_mode": validate_mode,
+        "push_mode": PUSH_MODE,
+        "note": "DP + IE + Solar(validate/push) + schedules (times/day & days considered + after-meal number in message)"
+    }
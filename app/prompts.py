@@ -5,7 +5,10 @@ Do not guess or hallucinate. If a value is not found, return an empty string.
 """
 
 def validate_user_prompt(parsed_html: str, extracted_json: str) -> str:
-    return f"""Parsed prescription (source of truth):
+    """
+    parsed_html: DP HTML 또는 app/docparse.py 의 compact 표 ("셀 | 셀 | ..." 한 줄 = 한 행)
+    """
+    return f"""Parsed prescription (source of truth, one table row per line when compacted):
 
 {parsed_html}
 
@@ -0,0 +1,313 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+
+import httpx
+import openai
+import requests
+
+from app import metrics
+
+# ---------------------------
+# Upstage 호출 resilience layer (sync / async 공용 정책)
+# - endpoint 별 latency budget: 재시도까지 포함한 전체 시간 상한. 각 시도의 timeout 은 남은 budget 으로 줄어든다.
+#   (async 는 시도마다 asyncio.wait_for 로 wall-clock 상한. sync 는 httpx/requests timeout 이 read 단위라
+#    느리게 흘러 들어오는 응답은 budget 을 조금 넘길 수 있다)
+# - hedge: 한 시도가 최근 p95 를 넘기면 같은 요청을 하나 더 보내서 먼저 끝난 쪽을 쓴다 (UPSTAGE_HEDGE 에 지정한 endpoint 만)
+# - retry: 재시도 가능한 오류(429/5xx/timeout/연결 오류)만 full-jitter backoff 로 다시 보낸다
+# - circuit breaker: 연속 실패가 쌓이면 UPSTAGE_BREAKER_RESET_S 동안 바로 실패시키고, 그 뒤 한 번 시험 호출
+# ---------------------------
+
+RETRY_MAX = int(os.getenv("UPSTAGE_RETRY_MAX", "2"))
+RETRY_BASE_S = float(os.getenv("UPSTAGE_RETRY_BASE_MS", "250")) / 1000
+RETRY_CAP_S = float(os.getenv("UPSTAGE_RETRY_CAP_MS", "4000")) / 1000
+HEDGE_ENDPOINTS = {e.strip() for e in os.getenv("UPSTAGE_HEDGE", "").split(",") if e.strip()}
+HEDGE_MIN_SAMPLES = int(os.getenv("UPSTAGE_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = int(os.getenv("UPSTAGE_LATENCY_WINDOW", "200"))
+BREAKER_FAILURES = int(os.getenv("UPSTAGE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("UPSTAGE_BREAKER_RESET_S", "30"))
+
+BUDGETS = {
+    "docparse": float(os.getenv("UPSTAGE_BUDGET_DOCPARSE_S", "90")),
+    "ie": float(os.getenv("UPSTAGE_BUDGET_IE_S", "90")),
+    "solar": float(os.getenv("UPSTAGE_BUDGET_SOLAR_S", "60")),
+}
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    httpx.TransportError,
+    requests.ConnectionError,
+    requests.Timeout,
+    openai.APIConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,  # 3.10 에서는 TimeoutError 와 다른 클래스 (wait_for 가 던진다)
+    ConnectionError,
+)
+
+
+class UpstreamError(RuntimeError):
+    """
+    Upstage 가 오류 응답을 준 경우. status_code 로 재시도 여부를 판단한다.
+    """
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpen(UpstreamError):
+    pass
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, CircuitOpen):
+        return False
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(e, RETRYABLE_EXCEPTIONS)
+
+
+def backoff(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_CAP_S, RETRY_BASE_S * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    closed -> (연속 실패 BREAKER_FAILURES 번) -> open -> (BREAKER_RESET_S 후) half-open: 시험 호출 1개만 통과
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_S):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def before(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._probing:
+                self._probing = True
+                return
+        metrics.upstream_rejected.inc(self.name)
+        raise CircuitOpen(f"{self.name}: circuit open, failing fast")
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or self._consecutive >= self.failures:
+                if self._opened_at is None:
+                    print(f"[UPSTAGE] circuit open: {self.name}")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """
+        시험 호출이 결과 없이 끝난 경우 (취소 등). open 상태는 그대로 두고 다음 호출이 다시 시험할 수 있게 한다.
+        """
+        with self._lock:
+            self._probing = False
+
+
+class Policy:
+    def __init__(self, name: str, budget: float, hedge: bool):
+        self.name = name
+        self.budget = budget
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(name)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self) -> float | None:
+        """
+        최근 성공 호출의 p95. 샘플이 모자라거나 hedge 꺼져 있으면 None
+        """
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            window = sorted(self._latencies)
+        return window[min(len(window) - 1, int(0.95 * len(window)))]
+
+
+POLICIES = {name: Policy(name, budget, name in HEDGE_ENDPOINTS) for name, budget in BUDGETS.items()}
+
+
+def _budget_exceeded(policy: Policy, last: BaseException | None):
+    if last is not None:
+        return last
+    return TimeoutError(f"{policy.name}: latency budget {policy.budget}s exceeded")
+
+
+# ---------------------------
+# sync (app/upstage_client.py)
+# ---------------------------
+
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("UPSTAGE_HEDGE_THREADS", "8")), thread_name_prefix="upstage-hedge")
+
+
+def _timed(policy: Policy, fn, timeout: float):
+    started = time.perf_counter()
+    result = fn(timeout)
+    policy.observe(time.perf_counter() - started)
+    return result
+
+
+def _attempt(policy: Policy, fn, timeout: float):
+    delay = policy.hedge_delay()
+    if delay is None or delay >= timeout:
+        return _timed(policy, fn, timeout)
+
+    first = _hedge_pool.submit(_timed, policy, fn, timeout)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    metrics.upstream_hedges.inc(policy.name)
+    second = _hedge_pool.submit(_timed, policy, fn, timeout - delay)
+    last = None
+    for f in as_completed([first, second]):
+        try:
+            return f.result()
+        except Exception as e:
+            last = e
+    raise last
+
+
+def call(endpoint: str, fn):
+    """
+    fn(timeout_seconds) -> 결과. 정책(budget / hedge / retry / breaker)을 적용해 호출한다.
+    """
+    policy = POLICIES[endpoint]
+    deadline = time.monotonic() + policy.budget
+    last = None
+
+    for attempt in range(RETRY_MAX + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        policy.breaker.before()
+        try:
+            result = _attempt(policy, fn, remaining)
+        except Exception as e:
+            if not is_retryable(e):
+                policy.breaker.success()  # upstream 은 응답했다 (4xx / 파싱 오류 등)
+                raise
+            policy.breaker.failure()
+            last = e
+        except BaseException:
+            policy.breaker.release()
+            raise
+        else:
+            policy.breaker.success()
+            return result
+        if attempt == RETRY_MAX:
+            break
+        pause = backoff(attempt)
+        if time.monotonic() + pause >= deadline:
+            break
+        metrics.upstream_retries.inc(endpoint)
+        print(f"[UPSTAGE] {endpoint} retry {attempt + 1}/{RETRY_MAX} after {pause:.2f}s: {last!r}")
+        time.sleep(pause)
+
+    raise _budget_exceeded(policy, last)
+
+
+# ---------------------------
+# async (app/upstage_async_client.py)
+# ---------------------------
+
+async def _atimed(policy: Policy, fn, timeout: float):
+    started = time.perf_counter()
+    result = await fn(timeout)
+    policy.observe(time.perf_counter() - started)
+    return result
+
+
+async def _aattempt(policy: Policy, fn, timeout: float):
+    delay = policy.hedge_delay()
+    if delay is None or delay >= timeout:
+        return await _atimed(policy, fn, timeout)
+
+    first = asyncio.create_task(_atimed(policy, fn, timeout))
+    done, _ = await asyncio.wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    metrics.upstream_hedges.inc(policy.name)
+    pending = {first, asyncio.create_task(_atimed(policy, fn, timeout - delay))}
+    last = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+                last = t.exception()
+        raise last
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+async def acall(endpoint: str, fn):
+    """
+    call() 의 async 버전. fn(timeout_seconds) -> awaitable
+    시도마다 asyncio.wait_for(남은 budget) 로 감싸서 budget 이 실제 wall-clock 상한이 되게 한다.
+    """
+    policy = POLICIES[endpoint]
+    deadline = time.monotonic() + policy.budget
+    last = None
+
+    for attempt in range(RETRY_MAX + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        policy.breaker.before()
+        try:
+            result = await asyncio.wait_for(_aattempt(policy, fn, remaining), remaining)
+        except Exception as e:
+            if not is_retryable(e):
+                policy.breaker.success()  # upstream 은 응답했다 (4xx / 파싱 오류 등)
+                raise
+            policy.breaker.failure()
+            last = e
+        except BaseException:
+            policy.breaker.release()  # 취소된 시험 호출이 half-open 을 막지 않게
+            raise
+        else:
+            policy.breaker.success()
+            return result
+        if attempt == RETRY_MAX:
+            break
+        pause = backoff(attempt)
+        if time.monotonic() + pause >= deadline:
+            break
+        metrics.upstream_retries.inc(endpoint)
+        print(f"[UPSTAGE] {endpoint} retry {attempt + 1}/{RETRY_MAX} after {pause:.2f}s: {last!r}")
+        await asyncio.sleep(pause)
+
+    raise _budget_exceeded(policy, last)
@@ -1,48 +1,563 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import heapq
+import itertools
+import threading
+from collections import deque
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
+from types import MappingProxyType
 from zoneinfo import ZoneInfo
 
+from app import metrics
+from app.instruction_parser import expand_med_rule
+
+SENT_HISTORY = int(os.getenv("SCHEDULE_SENT_HISTORY", "10000"))
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "event")  # event | interval
+INTERVAL_SECONDS = int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "5"))
+SCHEDULE_STORE = os.getenv("SCHEDULE_STORE", "sqlite")  # sqlite | memory
+SCHEDULE_DB_PATH = os.getenv("SCHEDULE_DB_PATH", "data/schedules.db")
+DUE_BATCH = int(os.getenv("SCHEDULE_DUE_BATCH", "1000"))
+LOOKAHEAD_SECONDS = float(os.getenv("SCHEDULE_LOOKAHEAD_HOURS", "24")) * 3600
+SHARED_META_MAX = int(os.getenv("SCHEDULE_SHARED_META_MAX", "100000"))
+
+
+def fire_at_epoch(fire_at: str, tz: str) -> float:
+    """
+    ISO fire_at 문자열 -> UTC epoch seconds. tz 정보가 없으면 tz 기준으로 해석.
+    """
+    dt = datetime.fromisoformat(fire_at)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=ZoneInfo(tz))
+    return dt.timestamp()
+
+
+_shared_meta = {}
+
+
+def _share_meta(meta: dict):
+    """
+    같은 약의 dose 들은 meta 가 day 빼고 전부 같다. -> day 를 뺀 나머지를 읽기 전용 객체 하나로 공유.
+    """
+    if not meta:
+        return None, None
+    day = meta.get("day")
+    base = {k: v for k, v in meta.items() if k != "day"}
+    try:
+        key = tuple(base.items())
+        shared = _shared_meta.get(key)
+    except TypeError:  # unhashable 값이 있으면 공유하지 않는다
+        return MappingProxyType(base), day
+    if shared is None:
+        if len(_shared_meta) >= SHARED_META_MAX:
+            _shared_meta.clear()
+        shared = _shared_meta[key] = MappingProxyType(base)
+    return shared, day
+
+
+class ScheduleRecord:
+    """
+    store 내부용 스케줄 항목. dict 대신 __slots__ 로 항목당 메모리를 줄이고,
+    message 는 intern, meta 는 (day 를 뺀) 공유 객체 + day 슬롯으로 들고 있는다.
+    store 밖으로 나가는 것은 tick 의 type / message 뿐이고, schedules.json 등 artifact 는 pipeline 의 dict 를 그대로 쓴다.
+    """
+
+    __slots__ = ("epoch", "seq", "fire_at", "type", "message", "meta", "day", "id", "sent", "sent_at", "cancelled")
+
+    def __init__(self, fire_at, epoch, type=None, message=None, meta=None, day=None, id=None, seq=0):
+        self.epoch = epoch
+        self.seq = seq
+        self.fire_at = fire_at
+        self.type = sys.intern(type) if type else type
+        self.message = sys.intern(message) if message else message
+        self.meta = meta
+        self.day = day
+        self.id = id
+        self.sent = False
+        self.sent_at = None
+        self.cancelled = False
+
+    @classmethod
+    def from_dict(cls, s: dict, tz: str, seq=0, id=None):
+        meta, day = _share_meta(s.get("meta"))
+        return cls(s["fire_at"], fire_at_epoch(s["fire_at"], tz), s.get("type"), s.get("message"), meta, day, id, seq)
+
+    def __lt__(self, other):
+        return (self.epoch, self.seq) < (other.epoch, other.seq)
+
+
+def _expand_rule_window(rule: dict, next_day: int, horizon: float, tz: str):
+    """
+    반복 규칙을 next_day 부터 하루 단위로 펼치되, 그날 첫 복약이 horizon 을 넘으면 멈춘다.
+    returns: (items, next_day, next_expand_epoch | None)  -- None 이면 규칙 소진
+    """
+    items = []
+    while next_day <= rule["days"]:
+        day_items = list(expand_med_rule(rule, next_day, next_day))
+        first = min((fire_at_epoch(it["fire_at"], tz) for it in day_items), default=None)
+        if first is not None and first > horizon:
+            return items, next_day, first - LOOKAHEAD_SECONDS
+        items.extend(day_items)
+        next_day += 1
+    return items, next_day, None
+
+
 class InMemoryScheduleStore:
-    def __init__(self):
-        self.items = []
+    """
+    pending 항목은 (fire_at_epoch, seq) 순으로 정렬되는 ScheduleRecord min-heap 에 두고,
+    due() 는 지금까지 도래한 항목만 heap 에서 꺼낸다. -> O(k log n)
+    발송 완료 항목은 heap 밖의 sent 히스토리(최근 SENT_HISTORY 개)로 옮긴다.
+    반복 규칙(add_rules)은 LOOKAHEAD_SECONDS 창 안에 들어온 날만 heap 으로 펼친다.
+    """
+
+    def __init__(self, tz="Asia/Seoul"):
+        self.tz = tz
+        self._heap = []
+        self._rules = []
+        self._inflight = {}
+        self._cancelled = 0
+        self.sent = deque(maxlen=SENT_HISTORY)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, fn):
+        """
+        fn(epoch): 가장 이른 pending fire_at 이 앞당겨질 때 호출된다.
+        """
+        self._listeners.append(fn)
+
+    def add_many(self, schedules):
+        """
+        returns: 추가된 항목 handle 목록 (replace_many 에 사용)
+        """
+        added = []
+        with self._lock:
+            prev = self._heap[0].epoch if self._heap else None
+            for s in schedules:
+                if not s.get("fire_at"):
+                    continue
+                rec = ScheduleRecord.from_dict(s, self.tz, seq=next(self._seq))
+                heapq.heappush(self._heap, rec)
+                added.append(rec)
+            earliest = self._heap[0].epoch if self._heap else None
+
+        if earliest is not None and (prev is None or earliest < prev):
+            for fn in self._listeners:
+                fn(earliest)
+        return added
+
+    def replace_many(self, pairs):
+        """
+        pairs: [(add_many 가 돌려준 handle, 새 스케줄 dict)]
+        아직 발송 전인 항목만 취소하고 새 항목으로 바꾼다. (이미 나간 슬롯은 그대로 둔다)
+        returns: 바꾼 개수
+        """
+        new_items = []
+        with self._lock:
+            for rec, s in pairs:
+                if rec.sent or rec.cancelled or id(rec) in self._inflight:
+                    continue
+                rec.cancelled = True
+                self._cancelled += 1
+                new_items.append(s)
+        self.add_many(new_items)
+        return len(new_items)
+
+    def add_rules(self, rules):
+        with self._lock:
+            for r in rules:
+                self._rules.append({"rule": r, "next_day": 1, "next_expand": 0.0})
+        self.expand_rules()
+
+    def expand_rules(self):
+        now = time.time()
+        horizon = now + LOOKAHEAD_SECONDS
+        items = []
+        with self._lock:
+            alive = []
+            for entry in self._rules:
+                if entry["next_expand"] <= now:
+                    got, entry["next_day"], entry["next_expand"] = _expand_rule_window(
+                        entry["rule"], entry["next_day"], horizon, self.tz
+                    )
+                    items.extend(got)
+                if entry["next_expand"] is not None:
+                    alive.append(entry)
+            self._rules = alive
+        if items:
+            self.add_many(items)
+
+    def due(self, tz=None):
+        """
+        fire_at <= now 인 미발송 항목 (이전에 꺼냈지만 mark_sent 안 된 항목 포함)
+        """
+        now = time.time()
+        with self._lock:
+            while self._heap and self._heap[0].epoch <= now:
+                it = heapq.heappop(self._heap)
+                if it.cancelled:
+                    self._cancelled -= 1
+                    continue
+                self._inflight[id(it)] = it
+            return list(self._inflight.values())
+
+    def mark_sent(self, it):
+        it.sent = True
+        it.sent_at = datetime.now().isoformat()
+        with self._lock:
+            self._inflight.pop(id(it), None)
+            self.sent.append(it)
+
+    def mark_sent_many(self, items):
+        for it in items:
+            self.mark_sent(it)
+
+    def next_fire_epoch(self):
+        """
+        가장 이른 pending 항목 또는 다음 규칙 펼침 시각의 epoch (없으면 None)
+        """
+        with self._lock:
+            if self._inflight:
+                return time.time()
+            candidates = [e["next_expand"] for e in self._rules]
+            if self._heap:
+                candidates.append(self._heap[0].epoch)
+            return min(candidates) if candidates else None
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._heap) - self._cancelled + len(self._inflight)
+
+
+class SQLiteScheduleStore:
+    """
+    InMemoryScheduleStore 와 같은 인터페이스의 SQLite(WAL) 영속 store.
+    - 재시작해도 미발송 알림이 남는다.
+    - (sent, fire_at_epoch) 인덱스로 due / next_fire_epoch 조회가 행 수와 무관하게 빠르다.
+    - add_many 는 한 트랜잭션 bulk insert, mark_sent_many 는 한 트랜잭션 batch update.
+    - sent: 0 = 대기, 2 = dispatcher 가 가져감(claimed), 1 = 발송 완료. due 가 원자적으로 claim 하므로
+      여러 프로세스가 같은 DB 를 써도 중복 발송하지 않는다. (claim 후 mark_sent 전에 죽으면 그 알림은 다시 보내지 않는다)
+    - 반복 규칙은 schedule_rules 에 두고, 창 안에 들어온 날만 schedules 로 펼친다.
+    """
+
+    def __init__(self, path=SCHEDULE_DB_PATH, tz="Asia/Seoul"):
+        self.tz = tz
+        self.path = path
+        self._listeners = []
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS schedules (
+                id INTEGER PRIMARY KEY,
+                fire_at TEXT NOT NULL,
+                fire_at_epoch REAL NOT NULL,
+                type TEXT,
+                message TEXT,
+                meta TEXT,
+                sent INTEGER NOT NULL DEFAULT 0,
+                sent_at TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_schedules_due ON schedules (sent, fire_at_epoch)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS schedule_rules (
+                id INTEGER PRIMARY KEY,
+                rule TEXT NOT NULL,
+                next_day INTEGER NOT NULL DEFAULT 1,
+                next_expand_epoch REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_schedule_rules_expand ON schedule_rules (next_expand_epoch)"
+        )
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def _min_pending(self):
+        row = self._conn.execute(
+            "SELECT MIN(fire_at_epoch) FROM schedules WHERE sent = 0"
+        ).fetchone()
+        return row[0]
+
+    def _rows(self, schedules):
+        return [
+            (
+                s["fire_at"],
+                fire_at_epoch(s["fire_at"], self.tz),
+                s.get("type"),
+                s.get("message"),
+                json.dumps(s.get("meta") or {}, ensure_ascii=False),
+            )
+            for s in schedules
+            if s.get("fire_at")
+        ]
+
+    def _insert(self, rows):
+        self._conn.executemany(
+            "INSERT INTO schedules (fire_at, fire_at_epoch, type, message, meta) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _notify(self, prev, rows):
+        if not rows:
+            return
+        earliest = min(r[1] for r in rows)
+        if prev is None or earliest < prev:
+            for fn in self._listeners:
+                fn(earliest)
 
     def add_many(self, schedules):
-        for s in schedules:
-            s["sent"] = False
-            self.items.append(s)
+        """
+        returns: 추가된 행 id 목록 (replace_many 에 사용)
+        """
+        rows = self._rows(schedules)
+        if not rows:
+            return []
+
+        with self._lock:
+            prev = self._min_pending()
+            self._conn.execute("BEGIN")
+            try:
+                self._insert(rows)
+                # lock 안의 한 트랜잭션이라 INTEGER PRIMARY KEY 가 연속으로 붙는다
+                last = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        self._notify(prev, rows)
+        return list(range(last - len(rows) + 1, last + 1))
 
-    def due(self, tz="Asia/Seoul"):
-        now = datetime.now(ZoneInfo(tz))
-        due_items = []
+    def replace_many(self, pairs):
+        """
+        pairs: [(add_many 가 돌려준 id, 새 스케줄 dict)]. 아직 발송 전인 행만 지우고 새 행을 넣는다.
+        returns: 바꾼 개수
+        """
+        with self._lock:
+            prev = self._min_pending()
+            self._conn.execute("BEGIN")
+            try:
+                rows = []
+                for row_id, s in pairs:
+                    cur = self._conn.execute("DELETE FROM schedules WHERE id = ? AND sent = 0", (row_id,))
+                    if cur.rowcount:
+                        rows.extend(self._rows([s]))
+                self._insert(rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
 
-        for it in self.items:
-            if it.get("sent") or not it.get("fire_at"):
-                continue
+        self._notify(prev, rows)
+        return len(rows)
 
-            fire_at = datetime.fromisoformat(it["fire_at"])
+    def add_rules(self, rules):
+        if not rules:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO schedule_rules (rule) VALUES (?)",
+                    [(json.dumps(r, ensure_ascii=False),) for r in rules]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.expand_rules()
 
-            
-            if fire_at.tzinfo is None:
-                fire_at = fire_at.replace(tzinfo=ZoneInfo(tz))
+    def expand_rules(self):
+        """
+        next_expand_epoch 가 지난 규칙만 읽어서 창 안의 날을 schedules 로 펼친다. (한 트랜잭션)
+        """
+        now = time.time()
+        horizon = now + LOOKAHEAD_SECONDS
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM schedule_rules WHERE next_expand_epoch <= ? LIMIT 1", (now,)
+            ).fetchone() is None:
+                return
+            prev = self._min_pending()
+            # 다른 프로세스가 같은 규칙을 동시에 펼치지 않도록 읽기부터 write lock 안에서 한다
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self._conn.execute(
+                    "SELECT id, rule, next_day FROM schedule_rules WHERE next_expand_epoch <= ?",
+                    (now,)
+                ).fetchall()
 
-            if fire_at <= now:
-                due_items.append(it)
+                rows, updates, finished = [], [], []
+                for rule_id, rule_json, next_day in pending:
+                    items, next_day, next_expand = _expand_rule_window(json.loads(rule_json), next_day, horizon, self.tz)
+                    rows.extend(self._rows(items))
+                    if next_expand is None:
+                        finished.append((rule_id,))
+                    else:
+                        updates.append((next_day, next_expand, rule_id))
 
-        return due_items
+                self._insert(rows)
+                self._conn.executemany(
+                    "UPDATE schedule_rules SET next_day = ?, next_expand_epoch = ? WHERE id = ?", updates
+                )
+                self._conn.executemany("DELETE FROM schedule_rules WHERE id = ?", finished)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        self._notify(prev, rows)
+
+    def due(self, tz=None):
+        """
+        due 행을 sent = 2 (claimed) 로 바꾸면서 가져온다. (BEGIN IMMEDIATE 한 트랜잭션)
+        같은 DB 를 여러 프로세스가 쓰더라도 (--workers N, 배포 겹침) 한 행은 한 dispatcher 만 보낸다.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "UPDATE schedules SET sent = 2 WHERE id IN ("
+                    "SELECT id FROM schedules WHERE sent = 0 AND fire_at_epoch <= ? "
+                    "ORDER BY fire_at_epoch LIMIT ?"
+                    ") RETURNING id, fire_at, type, message, meta, fire_at_epoch",
+                    (time.time(), DUE_BATCH)
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        rows.sort(key=lambda r: (r[5], r[0]))  # RETURNING 순서는 보장되지 않는다
+        return [
+            ScheduleRecord.from_dict({"fire_at": r[1], "type": r[2], "message": r[3], "meta": json.loads(r[4] or "{}")}, self.tz, id=r[0])
+            for r in rows
+        ]
 
     def mark_sent(self, it):
-        it["sent"] = True
-        it["sent_at"] = datetime.now().isoformat()
+        self.mark_sent_many([it])
+
+    def mark_sent_many(self, items):
+        if not items:
+            return
+        sent_at = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE schedules SET sent = 1, sent_at = ? WHERE id = ?",
+                    [(sent_at, it.id) for it in items]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for it in items:
+            it.sent = True
+            it.sent_at = sent_at
 
-store = InMemoryScheduleStore()
+    def next_fire_epoch(self):
+        with self._lock:
+            nxt = self._min_pending()
+            rule_nxt = self._conn.execute("SELECT MIN(next_expand_epoch) FROM schedule_rules").fetchone()[0]
+        candidates = [x for x in (nxt, rule_nxt) if x is not None]
+        return min(candidates) if candidates else None
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM schedules WHERE sent = 0").fetchone()[0]
+
+
+class EventDispatcher:
+    """
+    고정 interval 폴링 대신, 가장 이른 fire_at 까지 잠들었다가 깨어나는 dispatcher.
+    store.add_many 가 더 이른 항목을 넣으면 즉시 깨워서 대기 시간을 다시 계산한다.
+    """
+
+    def __init__(self, store, tick, max_sleep: float = 3600):
+        self.store = store
+        self.tick = tick
+        self.max_sleep = max_sleep
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="schedule-dispatcher", daemon=True)
+        store.subscribe(self.wakeup)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def wakeup(self, epoch=None):
+        with self._cond:
+            self._dirty = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+                nxt = self.store.next_fire_epoch()
+                timeout = self.max_sleep if nxt is None else min(self.max_sleep, max(0.0, nxt - time.time()))
+            except Exception as e:
+                # 실패한 tick 뒤에는 due 항목이 그대로 남아 timeout 이 0 이 된다 -> 고정 간격 뒤에 다시 시도
+                print("[SCHEDULER] tick error:", repr(e))
+                timeout = INTERVAL_SECONDS
+
+            with self._cond:
+                if self._stopped:
+                    return
+                if not self._dirty and timeout > 0:
+                    self._cond.wait(timeout=timeout)
+                self._dirty = False
+                if self._stopped:
+                    return
+
+
+def _make_store():
+    if SCHEDULE_STORE == "memory":
+        return InMemoryScheduleStore()
+    return SQLiteScheduleStore(SCHEDULE_DB_PATH)
+
+
+store = _make_store()
 scheduler = BackgroundScheduler()
+dispatcher = None
+
+def start_scheduler(tz="Asia/Seoul", mode=SCHEDULER_MODE):
+    global dispatcher
+    store.tz = tz
 
-def start_scheduler(tz="Asia/Seoul"):
     def tick():
-        for it in store.due(tz=tz):
-           
-            print(f"[PUSH][{it['type']}] {it['message']}")
-            store.mark_sent(it)
+        with metrics.timed("scheduler_tick"):
+            store.expand_rules()
+            with metrics.timed("store_due"):
+                due_items = store.due(tz=tz)
+            for it in due_items:
+
+                print(f"[PUSH][{it.type}] {it.message}")
+                metrics.pushes_sent.inc(it.type)
+            store.mark_sent_many(due_items)
 
-    scheduler.add_job(tick, "interval", seconds=5)
-    scheduler.start()
+    if mode == "interval":
+        scheduler.add_job(tick, "interval", seconds=INTERVAL_SECONDS)
+        scheduler.start()
+    else:
+        dispatcher = EventDispatcher(store, tick)
+        dispatcher.start()
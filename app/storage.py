@@ -1,6 +1,8 @@
-import os, json, uuid
+import os, json, uuid, re
+import hashlib
 
 BASE = "data/runs"
+UPLOADS = "data/uploads"
 
 def new_run_dir():
     run_id = str(uuid.uuid4())
@@ -8,6 +10,15 @@ def new_run_dir():
     os.makedirs(path, exist_ok=True)
     return run_id, path
 
+def discard_run_dir(path):
+    """
+    업로드가 거부된 run 의 빈 디렉터리를 지운다. (이미 파일이 있으면 그대로 둔다)
+    """
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
 def save_text(path, name, content):
     with open(os.path.join(path, name), "w", encoding="utf-8") as f:
         f.write(content)
@@ -15,3 +26,74 @@ def save_text(path, name, content):
 def save_json(path, name, obj):
     with open(os.path.join(path, name), "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=2)
+
+def load_json(path, name):
+    p = os.path.join(path, name)
+    if not os.path.exists(p):
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def run_dir(run_id):
+    """
+    run_id(uuid) -> 기존 run 디렉터리 경로. 형식이 틀리거나 없으면 None.
+    """
+    try:
+        run_id = str(uuid.UUID(run_id))
+    except ValueError:
+        return None
+    path = os.path.join(BASE, run_id)
+    return path if os.path.isdir(path) else None
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ---------------------------
+# 업로드 blob 저장소 (content-addressed)
+# data/uploads/{sha[:2]}/{sha} 에 내용 기준으로 한 번만 저장하고,
+# run 디렉터리에는 input{ext} 링크 + upload.json(원래 파일명 등)만 둔다.
+# ---------------------------
+
+def upload_tmp_path(run_id):
+    tmp_dir = os.path.join(UPLOADS, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, f"{run_id}.part")
+
+def blob_path(sha256):
+    return os.path.join(UPLOADS, sha256[:2], sha256)
+
+def put_blob(tmp_path, sha256):
+    """
+    tmp_path 를 blob 으로 옮긴다. 같은 내용이 이미 있으면 tmp 만 지운다. (dedup)
+    returns: (blob 경로, 새로 저장했는지)
+    """
+    path = blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return path, False
+    os.replace(tmp_path, path)
+    return path, True
+
+def link_input(run_path, blob, filename, sha256, size):
+    """
+    run 디렉터리에 blob 을 가리키는 input{ext} 를 만든다. (symlink -> hardlink -> blob 경로 그대로)
+    returns: 파이프라인에 넘길 파일 경로
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,8}", ext):
+        ext = ""
+    link = os.path.join(run_path, f"input{ext}")
+    try:
+        os.symlink(os.path.relpath(blob, run_path), link)
+    except OSError:
+        try:
+            os.link(blob, link)
+        except OSError:
+            link = blob
+    save_json(run_path, "upload.json", {"filename": filename, "sha256": sha256, "bytes": size, "blob": blob})
+    return link
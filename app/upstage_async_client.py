@@ -0,0 +1,213 @@
+import os
+import base64
+import asyncio
+import httpx
+from openai import AsyncOpenAI
+
+from app.cache import SOLAR_CACHE_ENABLED, solar_cache, solar_cache_key
+from app.resilience import acall, UpstreamError
+
+from app.upstage_client import (
+    API_KEY,
+    BASE_URL,
+    IE_BASE_URL,
+    DOCPARSE_URL,
+    DOCPARSE_PARAMS,
+    CONNECT_TIMEOUT,
+    _httpx_limits,
+    _httpx_timeout,
+    IE_CHUNK_SIZE,
+    _ie_request,
+    _ie_result,
+)
+
+# ---------------------------
+# app/upstage_client.py 의 asyncio 버전
+# /run 처럼 async 엔드포인트에서 event loop를 막지 않도록
+# 네트워크 대기는 전부 await 로 처리한다.
+# ---------------------------
+
+# ---------------------------
+# 0) Client registry (async)
+#    base URL 별 keep-alive 커넥션 풀. event loop 안에서 만들고 재사용한다.
+# ---------------------------
+
+_clients = {}
+_http_clients = {}
+
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    client = _http_clients.get(base_url)
+    if client is None:
+        client = httpx.AsyncClient(limits=_httpx_limits(), timeout=_httpx_timeout())
+        _http_clients[base_url] = client
+    return client
+
+
+def get_openai_client(base_url: str) -> AsyncOpenAI:
+    client = _clients.get(base_url)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=API_KEY,
+            base_url=base_url,
+            timeout=_httpx_timeout(),
+            max_retries=0,  # 재시도는 app/resilience.py 가 맡는다
+            http_client=get_http_client(base_url),
+        )
+        _clients[base_url] = client
+    return client
+
+
+async def warm_clients():
+    """
+    FastAPI startup 에서 호출. 클라이언트를 만들고 base URL 마다 커넥션을 미리 열어둔다.
+    """
+    if not API_KEY:
+        return
+
+    get_http_client(DOCPARSE_URL)
+    get_http_client(IE_BASE_URL)
+    get_openai_client(BASE_URL)
+
+    async def _touch(base_url):
+        try:
+            await _http_clients[base_url].head(base_url, timeout=CONNECT_TIMEOUT)
+        except Exception:
+            pass
+
+    await asyncio.gather(*(_touch(u) for u in (DOCPARSE_URL, IE_BASE_URL, BASE_URL)))
+
+
+async def close_clients():
+    for client in _http_clients.values():
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+    _clients.clear()
+    _http_clients.clear()
+
+
+# ---------------------------
+# 1) Document Parse (httpx.AsyncClient)
+# ---------------------------
+
+async def document_parse(file_path: str) -> dict:
+    """
+    Upstage Document Parsing API (async)
+    file_path: pdf/jpg/png 등 업로드된 파일 경로
+    returns: response JSON dict
+    """
+    if not API_KEY:
+        raise RuntimeError("UPSTAGE_API_KEY not set")
+
+    url = DOCPARSE_URL
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+
+    data = dict(DOCPARSE_PARAMS)
+
+    async def _post(remaining):
+        # 파일 객체를 넘기면 httpx 가 multipart body 를 청크 단위로 읽어서 보낸다.
+        with open(file_path, "rb") as f:
+            files = {
+                "document": (
+                    os.path.basename(file_path),
+                    f,
+                    "application/octet-stream"
+                )
+            }
+            resp = await get_http_client(DOCPARSE_URL).post(
+                url, headers=headers, files=files, data=data, timeout=_httpx_timeout(remaining)
+            )
+
+        if not resp.is_success:
+            try:
+                err = resp.json()
+            except Exception:
+                err = resp.text
+            raise UpstreamError(f"Document Parse failed: {resp.status_code} {err}", resp.status_code)
+
+        return resp.json()
+
+    return await acall("docparse", _post)
+
+
+# ---------------------------
+# 2) Universal Extraction (AsyncOpenAI)
+# ---------------------------
+
+async def universal_extract(file_path: str, json_schema: dict) -> dict:
+    """
+    Upstage Universal Extraction (Information Extraction, async)
+    file_path: pdf/jpg/png 파일 경로
+    json_schema: response_format json_schema에 넣을 schema(dict)
+    returns: extracted json object(dict)
+    base64 body 는 파일을 청크 단위로 읽어 인코딩하면서 스트리밍한다.
+    """
+    if not API_KEY:
+        raise RuntimeError("UPSTAGE_API_KEY not set")
+
+    headers, head, tail = _ie_request(file_path, json_schema)
+
+    async def body():
+        yield head
+        with open(file_path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, IE_CHUNK_SIZE):
+                yield base64.b64encode(chunk)
+        yield tail
+
+    async def _post(remaining):
+        resp = await get_http_client(IE_BASE_URL).post(
+            f"{IE_BASE_URL}/chat/completions",
+            headers=headers,
+            content=body(),
+            timeout=_httpx_timeout(remaining),
+        )
+        return _ie_result(resp)
+
+    return await acall("ie", _post)
+
+
+# ---------------------------
+# 3) Solar Chat (AsyncOpenAI)
+# ---------------------------
+
+async def solar_chat(system: str, user: str, model: str = "solar-pro3", parse=None):
+    """
+    Solar LLM 호출 (async, 검증/푸시문구 생성에 사용)
+    memory → disk 순서로 solar_cache 를 먼저 확인한다.
+    parse 를 주면 parse(content) 를 돌려주고, 파싱에 성공한 응답만 캐시한다.
+    returns: message content (string) 또는 parse 결과
+    """
+    if not API_KEY:
+        raise RuntimeError("UPSTAGE_API_KEY not set")
+
+    key = solar_cache_key(model, system, user)
+    if SOLAR_CACHE_ENABLED:
+        cached = solar_cache.get_memory(key)
+        if cached is None:
+            cached = await asyncio.to_thread(solar_cache.disk.get, key)
+            if cached is not None:
+                solar_cache.memory.set(key, cached)
+        if cached is not None:
+            try:
+                return parse(cached) if parse else cached
+            except ValueError:
+                print("[SOLAR] cached response unparsable, calling solar again")
+
+    client = get_openai_client(BASE_URL)
+    resp = await acall("solar", lambda remaining: client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=0,
+        timeout=_httpx_timeout(remaining),
+    ))
+    choice = resp.choices[0]
+    content = choice.message.content
+    result = parse(content) if parse else content
+    if SOLAR_CACHE_ENABLED and content and choice.finish_reason == "stop":
+        await asyncio.to_thread(solar_cache.set, key, content)
+    return result
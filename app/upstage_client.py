@@ -1,13 +1,122 @@
 import os
 import json
 import base64
+import threading
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from app.cache import SOLAR_CACHE_ENABLED, solar_cache, solar_cache_key
+from app.resilience import call, UpstreamError
+
 load_dotenv()
 API_KEY = os.getenv("UPSTAGE_API_KEY")
 
+# 로컬 벤치마크 시 bench/fake_upstage.py 로 돌리려면 UPSTAGE_BASE_URL=http://127.0.0.1:8100/v1
+BASE_URL = os.getenv("UPSTAGE_BASE_URL", "https://api.upstage.ai/v1").rstrip("/")
+IE_BASE_URL = f"{BASE_URL}/information-extraction"
+DOCPARSE_URL = f"{BASE_URL}/document-digitization"
+
+POOL_SIZE = int(os.getenv("UPSTAGE_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("UPSTAGE_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("UPSTAGE_READ_TIMEOUT", "120"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTAGE_KEEPALIVE_EXPIRY", "60"))
+
+# ---------------------------
+# 0) Client registry
+#    base URL 별로 keep-alive 커넥션 풀을 하나씩 유지한다.
+#    (호출마다 OpenAI(...) / requests.post 를 새로 만들면 매번 TCP+TLS handshake)
+# ---------------------------
+
+_clients = {}
+_http_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _httpx_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_SIZE,
+        max_keepalive_connections=POOL_SIZE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _httpx_timeout(remaining: float = READ_TIMEOUT) -> httpx.Timeout:
+    """
+    remaining: 남은 latency budget (app/resilience.py). 한 시도의 timeout 이 budget 을 넘지 않게 줄인다.
+    """
+    return httpx.Timeout(min(READ_TIMEOUT, remaining), connect=min(CONNECT_TIMEOUT, remaining))
+
+
+def get_session() -> requests.Session:
+    """
+    Document Parse 용 requests.Session (커넥션 풀 공유)
+    """
+    with _clients_lock:
+        session = _clients.get(DOCPARSE_URL)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _clients[DOCPARSE_URL] = session
+        return session
+
+
+def get_openai_client(base_url: str) -> OpenAI:
+    """
+    base_url 별 OpenAI 클라이언트 (내부 httpx.Client 커넥션 풀 공유)
+    """
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            http_client = httpx.Client(limits=_httpx_limits(), timeout=_httpx_timeout())
+            client = OpenAI(
+                api_key=API_KEY,
+                base_url=base_url,
+                timeout=_httpx_timeout(),
+                max_retries=0,  # 재시도는 app/resilience.py 가 맡는다
+                http_client=http_client,
+            )
+            _http_clients[base_url] = http_client
+            _clients[base_url] = client
+        return client
+
+
+def warm_clients():
+    """
+    서버 시작 시 클라이언트를 미리 만들고 커넥션을 하나씩 열어둔다. (실패해도 무시)
+    """
+    if not API_KEY:
+        return
+
+    session = get_session()
+    get_openai_client(IE_BASE_URL)
+    get_openai_client(BASE_URL)
+
+    try:
+        session.head(DOCPARSE_URL, timeout=CONNECT_TIMEOUT)
+    except Exception:
+        pass
+    for base_url in (IE_BASE_URL, BASE_URL):
+        try:
+            _http_clients[base_url].head(base_url, timeout=CONNECT_TIMEOUT)
+        except Exception:
+            pass
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
+        _http_clients.clear()
+
 # ---------------------------
 # 1) Document Parse (requests)
 #    Playground 설정 반영:
@@ -18,6 +127,15 @@ API_KEY = os.getenv("UPSTAGE_API_KEY")
 #    - base64_encoding: ['figure']
 # ---------------------------
 
+DOCPARSE_PARAMS = {
+    "model": "document-parse-260128",
+    "mode": "enhanced",
+    "ocr": "auto",
+    "output_formats": "html",
+    "base64_encoding": "['figure']"
+}
+
+
 def document_parse(file_path: str) -> dict:
     """
     Upstage Document Parsing API
@@ -27,41 +145,38 @@ def document_parse(file_path: str) -> dict:
     if not API_KEY:
         raise RuntimeError("UPSTAGE_API_KEY not set")
 
-    url = "https://api.upstage.ai/v1/document-digitization"
+    url = DOCPARSE_URL
     headers = {"Authorization": f"Bearer {API_KEY}"}
 
-    data = {
-        "model": "document-parse-260128",
-        "mode": "enhanced",
-        "ocr": "auto",
-        "output_formats": "html",
-        "base64_encoding": "['figure']"
-    }
+    data = dict(DOCPARSE_PARAMS)
 
-    with open(file_path, "rb") as f:
-        files = {
-            "document": (
-                os.path.basename(file_path),
-                f,
-                "application/octet-stream"
+    def _post(remaining):
+        with open(file_path, "rb") as f:
+            files = {
+                "document": (
+                    os.path.basename(file_path),
+                    f,
+                    "application/octet-stream"
+                )
+            }
+            resp = get_session().post(
+                url,
+                headers=headers,
+                files=files,
+                data=data,
+                timeout=(min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
             )
-        }
-        resp = requests.post(
-            url,
-            headers=headers,
-            files=files,
-            data=data,
-            timeout=120
-        )
 
-    if not resp.ok:
-        try:
-            err = resp.json()
-        except Exception:
-            err = resp.text
-        raise RuntimeError(f"Document Parse failed: {resp.status_code} {err}")
+        if not resp.ok:
+            try:
+                err = resp.json()
+            except Exception:
+                err = resp.text
+            raise UpstreamError(f"Document Parse failed: {resp.status_code} {err}", resp.status_code)
+
+        return resp.json()
 
-    return resp.json()
+    return call("docparse", _post)
 
 
 def extract_html_from_docparse(resp_json: dict) -> str:
@@ -72,22 +187,22 @@ def extract_html_from_docparse(resp_json: dict) -> str:
             return v
 
 
-    def find_str(o):
-        if isinstance(o, dict):
-            for kk, vv in o.items():
-                if kk in ("html", "content", "text") and isinstance(vv, str) and vv.strip():
-                    return vv
-                got = find_str(vv)
-                if got:
-                    return got
-        elif isinstance(o, list):
-            for item in o:
-                got = find_str(item)
-                if got:
-                    return got
-        return ""
+    # 깊이 우선(key 순서대로) 탐색. 재귀 대신 iterator stack 을 써서 큰 응답도 선형으로 훑는다.
+    stack = [iter(resp_json.items())]
+    while stack:
+        try:
+            kk, vv = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        if kk in ("html", "content", "text") and isinstance(vv, str) and vv.strip():
+            return vv
+        if isinstance(vv, dict):
+            stack.append(iter(vv.items()))
+        elif isinstance(vv, list):
+            stack.append((None, item) for item in vv)
 
-    return find_str(resp_json) or ""
+    return ""
 
 
 # ---------------------------
@@ -96,81 +211,152 @@ def extract_html_from_docparse(resp_json: dict) -> str:
 #    model: information-extract
 # ---------------------------
 
-def _file_to_base64(filepath: str) -> str:
-    with open(filepath, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+IE_MODEL = "information-extract"
 
 
-def universal_extract(file_path: str, json_schema: dict) -> dict:
-    """
-    Upstage Universal Extraction (Information Extraction)
-    file_path: pdf/jpg/png 파일 경로
-    json_schema: response_format json_schema에 넣을 schema(dict)
-    returns: extracted json object(dict)
-    """
-    if not API_KEY:
-        raise RuntimeError("UPSTAGE_API_KEY not set")
+# base64 는 3바이트 단위로 인코딩되므로 3의 배수로 읽어야 조각 사이에 패딩이 끼지 않는다.
+IE_CHUNK_SIZE = 3 * 64 * 1024
+_B64_MARK = "__IE_FILE_BASE64__"
 
-    client = OpenAI(
-        api_key=API_KEY,
-        base_url="https://api.upstage.ai/v1/information-extraction"
-    )
 
-    b64 = _file_to_base64(file_path)
-
-    resp = client.chat.completions.create(
-        model="information-extract",
-        messages=[
+def _ie_body_parts(json_schema: dict) -> tuple[bytes, bytes]:
+    """
+    IE 요청 JSON 을 base64 자리 앞/뒤 두 조각으로 나눈다. (SDK 가 만드는 body 와 같은 형태)
+    """
+    body = {
+        "model": IE_MODEL,
+        "messages": [
             {
                 "role": "user",
                 "content": [
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:application/octet-stream;base64,{b64}"
+                            "url": f"data:application/octet-stream;base64,{_B64_MARK}"
                         }
                     }
                 ]
             }
         ],
-        response_format={
+        "response_format": {
             "type": "json_schema",
             "json_schema": {
                 "name": "prescription_schema",
                 "schema": json_schema
             }
         }
-    )
+    }
+    head, tail = json.dumps(body, ensure_ascii=False).split(_B64_MARK)
+    return head.encode("utf-8"), tail.encode("utf-8")
 
-    content = resp.choices[0].message.content
+
+def _ie_request(file_path: str, json_schema: dict):
+    """
+    returns: (headers, head, tail). Content-Length 는 파일 크기로 미리 계산한다.
+    """
+    head, tail = _ie_body_parts(json_schema)
+    b64_len = 4 * ((os.path.getsize(file_path) + 2) // 3)
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json",
+        "Content-Length": str(len(head) + b64_len + len(tail)),
+    }
+    return headers, head, tail
+
+
+def _iter_ie_body(file_path: str, head: bytes, tail: bytes):
+    yield head
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(IE_CHUNK_SIZE), b""):
+            yield base64.b64encode(chunk)
+    yield tail
+
+
+def _ie_result(resp) -> dict:
+    if resp.status_code >= 400:
+        try:
+            err = resp.json()
+        except Exception:
+            err = resp.text
+        raise UpstreamError(f"Information Extraction failed: {resp.status_code} {err}", resp.status_code)
+    content = resp.json()["choices"][0]["message"]["content"]
     return json.loads(content)
 
 
+def get_http_client(base_url: str) -> httpx.Client:
+    """
+    get_openai_client(base_url) 와 같은 커넥션 풀을 쓰는 httpx.Client
+    """
+    get_openai_client(base_url)
+    return _http_clients[base_url]
+
+
+def universal_extract(file_path: str, json_schema: dict) -> dict:
+    """
+    Upstage Universal Extraction (Information Extraction)
+    file_path: pdf/jpg/png 파일 경로
+    json_schema: response_format json_schema에 넣을 schema(dict)
+    returns: extracted json object(dict)
+
+    파일 전체를 base64 문자열로 만들지 않고, 청크 단위로 인코딩하면서 요청 body 를 스트리밍한다.
+    """
+    if not API_KEY:
+        raise RuntimeError("UPSTAGE_API_KEY not set")
+
+    headers, head, tail = _ie_request(file_path, json_schema)
+
+    def _post(remaining):
+        resp = get_http_client(IE_BASE_URL).post(
+            f"{IE_BASE_URL}/chat/completions",
+            headers=headers,
+            content=_iter_ie_body(file_path, head, tail),
+            timeout=_httpx_timeout(remaining),
+        )
+        return _ie_result(resp)
+
+    return call("ie", _post)
+
+
 # ---------------------------
 # 3) Solar Chat (OpenAI SDK style)
 #    base_url: /v1
 #    model: solar-pro3
 # ---------------------------
 
-def solar_chat(system: str, user: str, model: str = "solar-pro3") -> str:
+def solar_chat(system: str, user: str, model: str = "solar-pro3", parse=None):
     """
     Solar LLM 호출 (검증/푸시문구 생성에 사용)
-    returns: message content (string)
+    temperature=0 이므로 (model, system, user) 가 같으면 solar_cache 결과를 재사용한다.
+    parse 를 주면 parse(content) 를 돌려주고, 파싱에 성공한 응답만 캐시한다.
+    (잘린 / fence 로 감싼 JSON 이 캐시되어 같은 처방전 재시도가 계속 실패하지 않게)
+    returns: message content (string) 또는 parse 결과
     """
     if not API_KEY:
         raise RuntimeError("UPSTAGE_API_KEY not set")
 
-    client = OpenAI(
-        api_key=API_KEY,
-        base_url="https://api.upstage.ai/v1"
-    )
+    key = solar_cache_key(model, system, user)
+    if SOLAR_CACHE_ENABLED:
+        cached = solar_cache.get(key)
+        if cached is not None:
+            try:
+                return parse(cached) if parse else cached
+            except ValueError:
+                print("[SOLAR] cached response unparsable, calling solar again")
+
+    client = get_openai_client(BASE_URL)
 
-    resp = client.chat.completions.create(
+    resp = call("solar", lambda remaining: client.chat.completions.create(
         model=model,
         messages=[
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ],
-        temperature=0
-    )
-    return resp.choices[0].message.content
+        temperature=0,
+        timeout=_httpx_timeout(remaining),
+    ))
+    choice = resp.choices[0]
+    content = choice.message.content
+    result = parse(content) if parse else content
+    if SOLAR_CACHE_ENABLED and content and choice.finish_reason == "stop":
+        solar_cache.set(key, content)
+    return result
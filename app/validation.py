@@ -0,0 +1,78 @@
+import re
+
+from app.docparse import lookup_row, normalize_drug_name
+
+# ---------------------------
+# IE 결과 ↔ DP 행 index 로컬 교차 검증
+# IE instructions 가 같은 행의 용법과 (공백/대소문자 무시하고) 같으면 Solar 검증이 필요 없다.
+# ---------------------------
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _norm_instruction(s: str) -> str:
+    return _WS_RE.sub("", s or "").lower()
+
+
+def cross_check(ie_json: dict, index: dict) -> list[dict]:
+    """
+    약마다 {"drug_name", "status", "row_instructions"} 를 돌려준다.
+    status: match | mismatch | no_row (행을 못 찾음) | no_column (용법 열 없음)
+    """
+    checks = []
+    has_column = "instructions" in index.get("columns", {})
+    for med in ie_json.get("medications", []):
+        name = med.get("drug_name") or ""
+        row = lookup_row(index, name)
+        if row is None:
+            status, row_inst = "no_row", None
+        elif not has_column:
+            status, row_inst = "no_column", None
+        else:
+            row_inst = row["fields"].get("instructions", "")
+            same = _norm_instruction(row_inst) == _norm_instruction(med.get("instructions"))
+            status = "match" if same else "mismatch"
+        checks.append({"drug_name": name, "status": status, "row_instructions": row_inst})
+    return checks
+
+
+def mismatch_context(index: dict, meds: list[dict], fallback: str) -> str:
+    """
+    Solar 에 보낼 근거 텍스트. 대상 약들의 행을 모두 찾으면 header + 그 행들만,
+    약 목록 header 가 없거나 하나라도 못 찾으면 fallback(DP HTML 전체).
+    """
+    if not index.get("header"):
+        return fallback
+
+    rows = []
+    for med in meds:
+        row = lookup_row(index, med.get("drug_name") or "")
+        if row is None:
+            return fallback
+        if row not in rows:
+            rows.append(row)
+
+    lines = [" | ".join(index["header"])]
+    lines.extend(" | ".join(r["cells"]) for r in rows)
+    return "\n".join(lines)
+
+
+def merge_corrections(ie_json: dict, positions: list[int], corrected: dict) -> dict:
+    """
+    positions 위치의 약만 Solar 교정 결과로 바꾼다.
+    개수가 같으면 순서대로, 다르면 정규화한 약 이름으로 맞춘다. (못 맞춘 약은 IE 값 유지)
+    """
+    meds = [dict(m) for m in ie_json.get("medications", [])]
+    fixed = corrected.get("medications", [])
+
+    if len(fixed) == len(positions):
+        for pos, med in zip(positions, fixed):
+            meds[pos] = med
+    else:
+        by_name = {normalize_drug_name(m.get("drug_name")): m for m in fixed}
+        for pos in positions:
+            med = by_name.get(normalize_drug_name(meds[pos].get("drug_name")))
+            if med is not None:
+                meds[pos] = med
+
+    return {**ie_json, "medications": meds}
@@ -0,0 +1,220 @@
+"""
+build_med_schedules 마이크로 벤치마크
+
+만성질환 처방(약 5~8개, 90~180일, 1일 3~4회)으로 현재 구현과 이전(일자별 루프) 구현을
+같은 now 로 돌려서 결과가 완전히 같은지 확인하고 시간을 비교한다.
+
+    python -m bench.bench_schedules --days 180 --meds 6 --repeat 20
+"""
+import re
+import time
+import argparse
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from app import instruction_parser
+
+INSTRUCTIONS = ["식후30분", "식후 1시간", "식후", "취침전 식후", "4시간마다", "", "아침 저녁", "식후 30분 취침전"]
+
+
+# ---------------------------
+# 이전 구현 (비교 기준). 매 dose 마다 _now / ZoneInfo / med_message 를 다시 계산한다.
+# helper 도 baseline 과 같은 동작으로 여기에 둔다. (app.instruction_parser 쪽은 Directive 캐시를 타므로 기준이 될 수 없다)
+# ---------------------------
+
+def _to_int(s: str, default: int) -> int:
+    try:
+        v = int(str(s).strip())
+        return v if v > 0 else default
+    except:
+        return default
+
+
+def _clean_drug_name(name: str) -> str:
+    name = (name or "").strip()
+    return re.sub(r"^\d+\s*", "", name)
+
+
+def _action_word(drug_name: str) -> str:
+    if "외용" in drug_name or "점안" in drug_name:
+        return "사용"
+    return "복용"
+
+
+def _dt_at(date: datetime, hhmm: str, tz: str) -> datetime:
+    h, m = map(int, hhmm.split(":"))
+    return datetime(date.year, date.month, date.day, h, m, tzinfo=ZoneInfo(tz))
+
+
+def _evenly_spaced_times(start: datetime, end: datetime, count: int) -> list[datetime]:
+    if count <= 1:
+        return [start]
+    total_seconds = max(1, int((end - start).total_seconds()))
+    step = total_seconds // (count - 1)
+    return [start + timedelta(seconds=i * step) for i in range(count)]
+
+
+def _extract_after_meal_minutes(inst: str) -> int | None:
+    s = (inst or "").replace(" ", "")
+    m = re.search(r"식후(\d+)(분|시간)", s)
+    if not m:
+        return None
+    n = int(m.group(1))
+    return n if m.group(2) == "분" else n * 60
+
+
+def med_message(name: str, action: str, inst: str) -> str:
+    inst_no_space = (inst or "").replace(" ", "")
+
+    mins = _extract_after_meal_minutes(inst_no_space)
+    if mins is not None:
+        if mins % 60 == 0 and mins >= 60:
+            when = f"식사 {mins // 60}시간 후"
+        else:
+            when = f"식사 {mins}분 후"
+        return f"{when} {name} {action} 잊지 마세요, 꼭이요!"
+
+    if "식후" in inst_no_space:
+        return f"식사 후 {name} {action} 잊지 마세요, 꼭이요!"
+
+    if "취침전" in inst_no_space:
+        return f"취침 전 {name} {action} 잊지 마세요, 꼭이요!"
+
+    return f"{name} {action} 시간이에요, 꼭이요!"
+
+
+def _legacy_build(validated: dict, meal_times: dict, wake_sleep: dict, tz: str, now_fn):
+
+    def rollover(dt, only_if_today):
+        if only_if_today and dt <= now_fn(tz):
+            return dt + timedelta(days=1)
+        return dt
+
+    def spread(day_date, per_day, only_if_today):
+        start = _dt_at(day_date, wake_sleep["wake"], tz)
+        end = _dt_at(day_date, wake_sleep["sleep"], tz)
+        start = rollover(start, only_if_today)
+        end = start.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+        if end <= start:
+            end += timedelta(days=1)
+        return _evenly_spaced_times(start, end, per_day)
+
+    base_date = now_fn(tz)
+    schedules = []
+
+    for med in validated.get("medications", []):
+        raw_name = (med.get("drug_name") or "").strip()
+        name = _clean_drug_name(raw_name)
+        inst = (med.get("instructions") or "").strip()
+        inst_compact = inst.replace(" ", "")
+        action = _action_word(raw_name)
+        per_day = _to_int(med.get("times_per_day", "0"), 1)
+        days = _to_int(med.get("total_days", "0"), 1)
+
+        for day_idx in range(days):
+            day_date = base_date + timedelta(days=day_idx)
+            only_if_today = (day_idx == 0)
+
+            if "취침전" in inst_compact and "식후" in inst_compact:
+                rule = "after_meal_plus_before_sleep"
+                targets = [
+                    _dt_at(day_date, meal_times["breakfast"], tz) + timedelta(minutes=20),
+                    _dt_at(day_date, meal_times["lunch"], tz) + timedelta(minutes=20),
+                    _dt_at(day_date, meal_times["dinner"], tz) + timedelta(minutes=20),
+                    _dt_at(day_date, wake_sleep["sleep"], tz) - timedelta(minutes=30),
+                ]
+                targets = [rollover(t, only_if_today) for t in targets][:per_day]
+            elif _extract_after_meal_minutes(inst_compact) is not None:
+                mins = _extract_after_meal_minutes(inst_compact)
+                rule = "after_meal_numbered"
+                targets = [
+                    _dt_at(day_date, meal_times["breakfast"], tz) + timedelta(minutes=mins),
+                    _dt_at(day_date, meal_times["lunch"], tz) + timedelta(minutes=mins),
+                    _dt_at(day_date, meal_times["dinner"], tz) + timedelta(minutes=mins),
+                ]
+                targets = [rollover(t, only_if_today) for t in targets][:per_day]
+            elif "시간마다" in inst_compact:
+                rule = "times_per_day_spread"
+                targets = spread(day_date, per_day, only_if_today)
+            elif "식후" in inst_compact:
+                rule = "after_meal_default"
+                targets = [
+                    _dt_at(day_date, meal_times["breakfast"], tz) + timedelta(minutes=20),
+                    _dt_at(day_date, meal_times["lunch"], tz) + timedelta(minutes=20),
+                    _dt_at(day_date, meal_times["dinner"], tz) + timedelta(minutes=20),
+                ]
+                targets = [rollover(t, only_if_today) for t in targets][:per_day]
+            else:
+                rule = "fallback_spread"
+                targets = spread(day_date, per_day, only_if_today)
+
+            for t in targets:
+                schedules.append({
+                    "fire_at": t.isoformat(),
+                    "type": "MED",
+                    "message": med_message(name, action, inst),
+                    "meta": {"drug_name": name, "rule": rule, "raw_instructions": inst, "day": day_idx + 1}
+                })
+
+    return schedules
+
+
+def _prescription(n_meds: int, days: int) -> dict:
+    return {
+        "medications": [
+            {
+                "drug_name": f"{i + 1} 테스트정{i}mg",
+                "dose_per_time": "1",
+                "times_per_day": str(3 + i % 2),
+                "total_days": str(days),
+                "instructions": INSTRUCTIONS[i % len(INSTRUCTIONS)],
+            }
+            for i in range(n_meds)
+        ]
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="build_med_schedules micro-benchmark")
+    ap.add_argument("--meds", type=int, default=6)
+    ap.add_argument("--days", type=int, default=180)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--tz", default="Asia/Seoul")
+    args = ap.parse_args()
+
+    meal_times = {"breakfast": "08:00", "lunch": "12:30", "dinner": "19:00"}
+    wake_sleep = {"wake": "08:00", "sleep": "22:00"}
+    validated = _prescription(args.meds, args.days)
+
+    # 하루 중 여러 시각에서 결과가 같은지 확인 (이월 경계 포함)
+    real_now = instruction_parser._now
+    try:
+        for hhmm in ("00:00", "08:00", "08:21", "12:00", "18:59", "21:31", "23:59"):
+            h, m = map(int, hhmm.split(":"))
+            fixed = datetime.now(ZoneInfo(args.tz)).replace(hour=h, minute=m, second=0, microsecond=0)
+            instruction_parser._now = lambda tz, fixed=fixed: fixed
+            new = instruction_parser.build_med_schedules(validated, meal_times, wake_sleep, tz=args.tz)
+            old = _legacy_build(validated, meal_times, wake_sleep, args.tz, lambda tz, fixed=fixed: fixed)
+            assert new == old, f"output mismatch at now={hhmm}"
+    finally:
+        instruction_parser._now = real_now
+    print(f"identical output: OK ({len(new)} doses)")
+
+    def bench(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    t_new = bench(lambda: instruction_parser.build_med_schedules(validated, meal_times, wake_sleep, tz=args.tz))
+    t_old = bench(lambda: _legacy_build(validated, meal_times, wake_sleep, args.tz, real_now))
+
+    print(f"meds={args.meds} days={args.days} doses={len(new)}")
+    print(f"legacy  : {t_old * 1000:8.2f} ms")
+    print(f"current : {t_new * 1000:8.2f} ms  (x{t_old / t_new:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Upstage API 로컬 대역 서버 (벤치마크 / 부하 테스트용, API quota 소모 없음)
+
+app/upstage_client.py 가 쓰는 응답 형태만 흉내낸다.
+- POST /v1/document-digitization                     (Document Parse)
+- POST /v1/information-extraction/chat/completions   (Information Extraction)
+- POST /v1/chat/completions                          (Solar: validate / push)
+
+실행:
+    python -m bench.fake_upstage --port 8100 --dp-ms 1500 --ie-ms 2500 --solar-ms 3000 --error-rate 0.01
+
+앱을 이 서버로 돌리려면:
+    UPSTAGE_BASE_URL=http://127.0.0.1:8100/v1 UPSTAGE_API_KEY=fake uvicorn app.main:app
+"""
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+CONFIG = {
+    "dp_ms": float(os.getenv("FAKE_DP_MS", "1500")),
+    "ie_ms": float(os.getenv("FAKE_IE_MS", "2500")),
+    "solar_ms": float(os.getenv("FAKE_SOLAR_MS", "3000")),
+    "jitter": float(os.getenv("FAKE_JITTER", "0.2")),
+    "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+}
+
+MEDICATIONS = [
+    {"drug_name": "1 타이레놀정500mg", "dose_per_time": "1", "times_per_day": "3", "total_days": "5", "instructions": "식후30분"},
+    {"drug_name": "2 무코스타정", "dose_per_time": "1", "times_per_day": "3", "total_days": "5", "instructions": "식후 30분"},
+    {"drug_name": "3 크라비트점안액", "dose_per_time": "1", "times_per_day": "4", "total_days": "7", "instructions": "4시간마다 점안"},
+]
+
+HTML = (
+    "<h1 id='0'>처방전</h1>"
+    "<table id='1'>"
+    "<tr><th>처방 의약품의 명칭</th><th>1회 투약량</th><th>1일 투여횟수</th><th>총 투약일수</th><th>용법</th></tr>"
+    + "".join(
+        f"<tr><td>{m['drug_name']}</td><td>{m['dose_per_time']}</td><td>{m['times_per_day']}</td>"
+        f"<td>{m['total_days']}</td><td>{m['instructions']}</td></tr>"
+        for m in MEDICATIONS
+    )
+    + "</table>"
+    "<figure id='2'><img src='data:image/png;base64," + "iVBORw0KGgo" * 2000 + "'/></figure>"
+)
+
+PUSH = {
+    "habit_pushes": [
+        {"time": "10:00", "habit": "물 한 잔 마시며 잠깐 쉬어가요 💧", "positive": "오늘도 잘하고 있어요."},
+        {"time": "16:00", "habit": "눈을 감고 1분만 쉬어요 🌿", "positive": "천천히 좋아지고 있어요."},
+        {"time": "19:00", "habit": "따뜻한 저녁으로 하루를 마무리해요 😊", "positive": "내일은 더 가벼울 거예요."},
+    ]
+}
+
+app = FastAPI(title="Fake Upstage API")
+
+
+async def _simulate(kind: str):
+    base = CONFIG[f"{kind}_ms"] / 1000
+    jitter = base * CONFIG["jitter"]
+    await asyncio.sleep(max(0.0, random.uniform(base - jitter, base + jitter)))
+    if random.random() < CONFIG["error_rate"]:
+        status = random.choice([429, 500, 503])
+        return JSONResponse({"error": {"message": f"fake {status}", "code": status}}, status_code=status)
+    return None
+
+
+def _completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.post("/v1/document-digitization")
+async def document_digitization(request: Request):
+    await request.body()
+    err = await _simulate("dp")
+    if err:
+        return err
+    return {
+        "api": "2.0",
+        "model": "document-parse-260128",
+        "content": {"html": HTML, "markdown": "", "text": ""},
+        "elements": [
+            {"id": 1, "category": "table", "page": 1, "content": {"html": HTML, "markdown": "", "text": ""}},
+        ],
+        "usage": {"pages": 1},
+    }
+
+
+@app.post("/v1/information-extraction/chat/completions")
+async def information_extraction(request: Request):
+    body = await request.json()
+    err = await _simulate("ie")
+    if err:
+        return err
+    return _completion(body.get("model", "information-extract"), json.dumps({"medications": MEDICATIONS}, ensure_ascii=False))
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    err = await _simulate("solar")
+    if err:
+        return err
+
+    system = next((m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system"), "")
+    if "validation" in system:
+        content = json.dumps({"medications": MEDICATIONS}, ensure_ascii=False)
+    else:
+        content = json.dumps(PUSH, ensure_ascii=False)
+    return _completion(body.get("model", "solar-pro3"), content)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake Upstage API server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8100)
+    ap.add_argument("--dp-ms", type=float, default=CONFIG["dp_ms"])
+    ap.add_argument("--ie-ms", type=float, default=CONFIG["ie_ms"])
+    ap.add_argument("--solar-ms", type=float, default=CONFIG["solar_ms"])
+    ap.add_argument("--jitter", type=float, default=CONFIG["jitter"], help="latency +/- ratio")
+    ap.add_argument("--error-rate", type=float, default=CONFIG["error_rate"], help="0~1, 429/500/503 응답 비율")
+    args = ap.parse_args()
+
+    CONFIG.update(
+        dp_ms=args.dp_ms,
+        ie_ms=args.ie_ms,
+        solar_ms=args.solar_ms,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
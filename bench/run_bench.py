@@ -0,0 +1,208 @@
+"""
+/run 엔드투엔드 벤치마크
+
+--spawn 을 주면 bench/fake_upstage.py 와 앱(uvicorn)을 임시 작업 디렉터리에서 직접 띄우고,
+앱이 fake 서버를 보도록 UPSTAGE_BASE_URL 을 바꿔서 API quota 없이 재현 가능하게 측정한다.
+
+    python -m bench.run_bench --spawn --requests 200 --concurrency 20
+    python -m bench.run_bench --spawn --requests 200 --concurrency 20 --no-cache --unique
+    python -m bench.run_bench --url http://127.0.0.1:8000 --pid <uvicorn pid> --file sample.pdf
+
+출력: throughput(req/s), latency p50/p90/p99, 실패 수, 앱 프로세스 peak RSS(VmHWM, Linux)
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss_kb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _percentile(sorted_values, q: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _wait_ready(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server not ready: {url}")
+
+
+def spawn(args):
+    """
+    fake upstage + app 을 subprocess 로 띄운다. returns (app_url, app_pid, procs)
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    fake_port, app_port = _free_port(), _free_port()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fake_upstage",
+            "--port", str(fake_port),
+            "--dp-ms", str(args.dp_ms),
+            "--ie-ms", str(args.ie_ms),
+            "--solar-ms", str(args.solar_ms),
+            "--error-rate", str(args.error_rate),
+        ],
+        cwd=workdir, env=env,
+    )
+
+    env.update(
+        UPSTAGE_API_KEY="fake",
+        UPSTAGE_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+        SCHEDULE_STORE="memory",
+    )
+    if args.no_cache:
+        env.update(EXTRACT_CACHE_ENABLED="0", SOLAR_CACHE_ENABLED="0")
+
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(app_port), "--log-level", "warning",
+        ],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+    )
+
+    _wait_ready(f"http://127.0.0.1:{fake_port}/docs")
+    _wait_ready(f"http://127.0.0.1:{app_port}/docs")
+    print(f"[BENCH] workdir={workdir} fake=:{fake_port} app=:{app_port}")
+    return f"http://127.0.0.1:{app_port}", app.pid, [app, fake]
+
+
+async def drive(url: str, payload: bytes, filename: str, n: int, concurrency: int, unique: bool, endpoint: str):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+    params = {"breakfast": "08:00", "lunch": "12:30", "dinner": "19:00", "wake": "08:00", "sleep": "22:00"}
+
+    async with httpx.AsyncClient(base_url=url, timeout=600) as client:
+
+        async def one(i: int):
+            body = payload + (f"\n%{uuid.uuid4().hex}\n".encode() if unique else b"")
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(endpoint, files={"pdf": (filename, body, "application/pdf")}, params=params)
+                    if r.status_code >= 400:
+                        errors.append(r.status_code)
+                    else:
+                        latencies.append(time.perf_counter() - t0)
+                except httpx.HTTPError as e:
+                    errors.append(type(e).__name__)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="/run end-to-end benchmark")
+    ap.add_argument("--url", default="http://127.0.0.1:8000", help="이미 떠 있는 앱 주소 (--spawn 이면 무시)")
+    ap.add_argument("--pid", type=int, default=None, help="peak RSS 를 읽을 앱 pid (--spawn 이면 자동)")
+    ap.add_argument("--spawn", action="store_true", help="fake upstage + 앱을 직접 띄워서 측정")
+    ap.add_argument("--endpoint", default="/run")
+    ap.add_argument("--file", default=None, help="업로드할 처방전 파일 (없으면 작은 더미 PDF)")
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--unique", action="store_true", help="요청마다 바이트를 바꿔 content-hash 캐시를 우회")
+    ap.add_argument("--no-cache", action="store_true", help="(--spawn) DP/IE/Solar 캐시 비활성화")
+    ap.add_argument("--dp-ms", type=float, default=1500)
+    ap.add_argument("--ie-ms", type=float, default=2500)
+    ap.add_argument("--solar-ms", type=float, default=3000)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--json", action="store_true", help="결과를 JSON 한 줄로 출력")
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            payload = f.read()
+        filename = os.path.basename(args.file)
+    else:
+        payload = b"%PDF-1.4\n% bench dummy prescription\n%%EOF\n"
+        filename = "bench.pdf"
+
+    procs = []
+    url, pid = args.url, args.pid
+    if args.spawn:
+        url, pid, procs = spawn(args)
+
+    try:
+        latencies, errors, elapsed = asyncio.run(
+            drive(url, payload, filename, args.requests, args.concurrency, args.unique, args.endpoint)
+        )
+    finally:
+        rss_kb = _peak_rss_kb(pid) if pid else None
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    latencies.sort()
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else None,
+        "latency_p50_s": _percentile(latencies, 0.50),
+        "latency_p90_s": _percentile(latencies, 0.90),
+        "latency_p99_s": _percentile(latencies, 0.99),
+        "peak_rss_mb": round(rss_kb / 1024, 1) if rss_kb else None,
+    }
+
+    if args.json:
+        print(json.dumps(report))
+        return
+
+    print(f"requests      : {report['requests']} (concurrency {report['concurrency']})")
+    print(f"ok / errors   : {report['ok']} / {report['errors']}" + (f"  {sorted(set(map(str, errors)))}" if errors else ""))
+    print(f"elapsed       : {report['elapsed_s']} s")
+    print(f"throughput    : {report['throughput_rps']} req/s")
+    for q in ("p50", "p90", "p99"):
+        v = report[f"latency_{q}_s"]
+        print(f"latency {q}   : {v:.3f} s" if v is not None else f"latency {q}   : -")
+    print(f"peak RSS      : {report['peak_rss_mb']} MB" if report["peak_rss_mb"] else "peak RSS      : - (pid 없음)")
+
+
+if __name__ == "__main__":
+    main()
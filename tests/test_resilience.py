@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("openai")
+pytest.importorskip("requests")
+
+from app import resilience
+from app.resilience import CircuitBreaker, CircuitOpen, UpstreamError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", c)
+    return c
+
+
+def test_opens_after_consecutive_failures(clock):
+    b = CircuitBreaker("t", failures=3, reset_seconds=10)
+    for _ in range(2):
+        b.before()
+        b.failure()
+    assert not b.is_open()
+    b.before()
+    b.failure()
+    assert b.is_open()
+    with pytest.raises(CircuitOpen):
+        b.before()
+
+
+def test_success_resets_consecutive_count(clock):
+    b = CircuitBreaker("t", failures=2, reset_seconds=10)
+    b.failure()
+    b.success()
+    b.failure()
+    assert not b.is_open()
+
+
+def test_half_open_allows_single_probe(clock):
+    b = CircuitBreaker("t", failures=1, reset_seconds=10)
+    b.failure()
+    clock.now += 10
+    b.before()  # probe
+    with pytest.raises(CircuitOpen):
+        b.before()
+    b.success()
+    assert not b.is_open()
+    b.before()
+
+
+def test_failed_probe_reopens(clock):
+    b = CircuitBreaker("t", failures=5, reset_seconds=10)
+    for _ in range(5):
+        b.failure()
+    clock.now += 10
+    b.before()
+    b.failure()
+    assert b.is_open()
+    with pytest.raises(CircuitOpen):
+        b.before()
+    clock.now += 10
+    b.before()
+
+
+def test_released_probe_can_be_retried(clock):
+    b = CircuitBreaker("t", failures=1, reset_seconds=10)
+    b.failure()
+    clock.now += 10
+    b.before()
+    b.release()
+    assert b.is_open()
+    b.before()
+
+
+def test_cancelled_async_probe_does_not_wedge_breaker(monkeypatch):
+    policy = resilience.Policy("solar", 5, False)
+    policy.breaker = CircuitBreaker("solar", failures=1, reset_seconds=0)
+    monkeypatch.setitem(resilience.POLICIES, "solar", policy)
+    policy.breaker.failure()
+
+    async def slow(timeout):
+        await asyncio.sleep(10)
+
+    async def ok(timeout):
+        return "ok"
+
+    async def run():
+        probe = asyncio.create_task(resilience.acall("solar", slow))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await resilience.acall("solar", ok)
+
+    assert asyncio.run(run()) == "ok"
+    assert not policy.breaker.is_open()
+
+
+def test_async_budget_is_wall_clock_cap(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX", 0)
+    policy = resilience.Policy("ie", 0.05, False)
+    monkeypatch.setitem(resilience.POLICIES, "ie", policy)
+
+    async def trickle(timeout):
+        await asyncio.sleep(10)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(resilience.acall("ie", trickle))
+
+
+def test_non_retryable_error_is_not_retried(monkeypatch):
+    policy = resilience.Policy("docparse", 5, False)
+    monkeypatch.setitem(resilience.POLICIES, "docparse", policy)
+    calls = []
+
+    def bad_request(timeout):
+        calls.append(timeout)
+        raise UpstreamError("bad", status_code=400)
+
+    with pytest.raises(UpstreamError):
+        resilience.call("docparse", bad_request)
+    assert len(calls) == 1
+    assert not policy.breaker.is_open()
@@ -8,7 +8,7 @@ import requests
 import streamlit as st
 import streamlit.components.v1 as components
 
-API_URL = "http://127.0.0.1:8000/run"
+API_BASE = "http://127.0.0.1:8000"
 TZ = "Asia/Seoul"
 
 st.set_page_config(page_title="Upstage Prescription Agent", layout="centered")
@@ -304,6 +304,7 @@ for k, v in {
     "schedules": [],
     "push": None,
     "validated": None,
+    "docparse_index": None,
 }.items():
     if k not in st.session_state:
         st.session_state[k] = v
@@ -320,7 +321,29 @@ def load_artifacts(artifacts_dir: str):
     schedules = load_json(os.path.join(artifacts_dir, "schedules.json")) or []
     push = load_json(os.path.join(artifacts_dir, "push.json"))
     validated = load_json(os.path.join(artifacts_dir, "validated.json"))
-    return schedules, push, validated
+    docparse_index = load_json(os.path.join(artifacts_dir, "docparse_index.json"))
+    return schedules, push, validated, docparse_index
+
+
+STAGE_LABELS = {
+    "saved": "업로드",
+    "docparse": "Document Parse",
+    "ie": "Information Extraction",
+    "validated": "Solar 검증",
+    "push": "생활 케어 푸시 생성",
+    "schedules": "알림 스케줄 등록",
+}
+
+
+def stream_events(run_id: str):
+    """
+    GET /runs/{run_id}/events (SSE) 를 읽어 이벤트 dict 를 하나씩 돌려준다.
+    """
+    with requests.get(f"{API_BASE}/runs/{run_id}/events", stream=True, timeout=(10, 600)) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                yield json.loads(line[len("data:"):].strip())
 
 
 def parse_fire_at(item):
@@ -339,21 +362,46 @@ def parse_fire_at(item):
 run_btn = st.button("실행하기", disabled=(uploaded is None))
 
 if run_btn and uploaded is not None:
+    progress = st.empty()
+    partial = st.empty()
+
     with st.spinner("처리 중..."):
         files = {"pdf": (uploaded.name, uploaded.getvalue(), uploaded.type or "application/octet-stream")}
         params = {"breakfast": breakfast, "lunch": lunch, "dinner": dinner, "wake": wake, "sleep": sleep}
 
-        r = requests.post(API_URL, files=files, params=params, timeout=600)
+        r = requests.post(f"{API_BASE}/runs", files=files, params=params, timeout=60)
         r.raise_for_status()
-        out = r.json()
+        run_id = r.json()["run_id"]
+
+        out = None
+        for ev in stream_events(run_id):
+            name = ev.get("event")
+            summary = ev.get("summary") or {}
+            if name in STAGE_LABELS:
+                progress.info(f"{STAGE_LABELS[name]} 완료 ({ev.get('elapsed_ms', 0) / 1000:.1f}s)")
+            if name in ("ie", "validated") and summary.get("medications"):
+                partial.dataframe(summary["medications"], use_container_width=True, hide_index=True)
+            if name == "error":
+                st.error(f"실패: {summary.get('error')}")
+                st.stop()
+            if name == "done":
+                out = summary
+
+        if out is None:
+            status = requests.get(f"{API_BASE}/runs/{run_id}", timeout=10).json()
+            out = status.get("result") or {}
+
+        progress.empty()
+        partial.empty()
 
         st.session_state.run_id = out.get("run_id")
         st.session_state.artifacts_dir = out.get("artifacts_dir")
 
-        schedules, push, validated = load_artifacts(st.session_state.artifacts_dir)
+        schedules, push, validated, docparse_index = load_artifacts(st.session_state.artifacts_dir)
         st.session_state.schedules = schedules
         st.session_state.push = push
         st.session_state.validated = validated
+        st.session_state.docparse_index = docparse_index
 
     st.success("완료!")
 
@@ -373,6 +421,22 @@ if st.session_state.artifacts_dir:
     st.write("Run ID:", st.session_state.run_id)
     st.code(st.session_state.artifacts_dir)
 
+    docparse_index = st.session_state.docparse_index or {}
+    if docparse_index.get("rows"):
+        st.markdown(dedent("<div class='card'><div style='font-weight:900;'>처방전 표 (Document Parse)</div>"), unsafe_allow_html=True)
+        header = docparse_index.get("header") or []
+        width = max(len(r["cells"]) for r in docparse_index["rows"])
+        names = []
+        for i in range(width):
+            name = header[i] if i < len(header) and header[i] else f"col{i + 1}"
+            names.append(name if name not in names else f"{name} ({i + 1})")
+        st.dataframe(
+            [dict(zip(names, r["cells"])) for r in docparse_index["rows"]],
+            use_container_width=True,
+            hide_index=True,
+        )
+        st.markdown("</div>", unsafe_allow_html=True)
+
     colA, colB = st.columns(2)
 
     with colA: